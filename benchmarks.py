@@ -0,0 +1,393 @@
+import timeit
+import time
+import json
+import os
+import random
+import tempfile
+import platform
+import subprocess
+import sys
+import chess
+import board
+import metadata
+
+
+
+
+
+def legacy_parse_moves(pgn : str) -> list:
+    """Parses moves the way Chess_moves did before the single-pass tokenizer, for comparison."""
+
+    formatted_game_data : list = chess.split_string_list([pgn], '[', ']')
+    formatted_move_sequence : list = chess.split_string_list(formatted_game_data, ',', ' ', '\n', '\r')
+    return [move for move in formatted_move_sequence if chess.check_is_move(move)]
+
+
+
+def benchmark_tokenizer(repeats : int = 200):
+    """Times parsing of the sample games with the legacy splitting approach and with the single-pass tokenizer."""
+
+    corpus = metadata.chess_data
+
+    legacy_time = timeit.timeit(lambda : [legacy_parse_moves(game) for game in corpus], number = repeats)
+    tokenizer_time = timeit.timeit(lambda : [chess.parse_pgn(game) for game in corpus], number = repeats)
+    #Games are tokenized lazily, so their length is taken to time the parsing and not just the constructor.
+    game_time = timeit.timeit(lambda : [len(chess.Chess_game(game)) for game in corpus], number = repeats)
+
+    games_parsed = repeats * len(corpus)
+
+    print(f'Legacy split parsing: {games_parsed / legacy_time:,.0f} games per second.')
+    print(f'Single-pass tokenizer: {games_parsed / tokenizer_time:,.0f} games per second ({legacy_time / tokenizer_time:.1f}x).')
+    print(f'Chess_game parsing: {games_parsed / game_time:,.0f} games per second.')
+
+
+
+
+
+#Known perft results for standard test positions, used to check move generation.
+perft_positions = [(board.start_fen, [20, 400, 8902, 197281]),
+                   ('r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1', [48, 2039, 97862]),
+                   ('8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1', [14, 191, 2812, 43238]),
+                   ('r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1', [6, 264, 9467]),
+                   ('rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8', [44, 1486, 62379])]
+
+
+
+def benchmark_perft() -> list:
+    """Checks the board's move generation against known perft results, and times how many nodes it visits per second.
+
+    Returns a (fen, depth, nodes, expected nodes) tuple for each result which did not match, so an empty list means move generation is correct."""
+
+    total_nodes, total_time = 0, 0.0
+    mismatches = []
+
+    for fen, expected in perft_positions:
+
+        position = board.Chess_position(fen)
+
+        for depth, expected_nodes in enumerate(expected, start = 1):
+
+            start = time.perf_counter()
+            nodes = position.perft(depth)
+            total_time += time.perf_counter() - start
+            total_nodes += nodes
+
+            if nodes != expected_nodes:
+                mismatches.append((fen, depth, nodes, expected_nodes))
+                print(f'Perft mismatch for {fen} at depth {depth}: {nodes} nodes, expected {expected_nodes}.')
+
+    print(f'Perft: {total_nodes:,} nodes at {total_nodes / total_time:,.0f} nodes per second.')
+    return mismatches
+
+
+
+
+
+#Termination phrases in the style of Chess.com, keyed by result from White's point of view.
+synthetic_terminations = {'1-0' : ['{white} won by checkmate', '{white} won by resignation', '{white} won on time'],
+                          '0-1' : ['{black} won by checkmate', '{black} won by resignation', '{black} won on time'],
+                          '1/2-1/2' : ['Game drawn by agreement', 'Game drawn by repetition', 'Game drawn by stalemate']}
+
+
+
+def random_line(generator : random.Random, plies : int, breadth : int = None) -> list:
+    """Plays random legal moves from the starting position, returning them in algebraic notation.
+
+    If a breadth is given, each move is picked from only that many of the legal moves, so lines drawn this way share many prefixes like a real repertoire."""
+
+    position = board.Chess_position()
+    moves = []
+
+    for _ in range(plies):
+
+        legal_moves = position.legal_moves()
+
+        if not legal_moves:
+            break
+
+        move = generator.choice(legal_moves[:breadth] if breadth else legal_moves)
+        moves.append(position.san(move))
+        position.make_move(move)
+
+    return moves
+
+
+
+def synthetic_pgn(generator : random.Random, plies : int) -> str:
+    """Returns a random game in the PGN format of the sample games, played by me as either colour."""
+
+    moves = random_line(generator, plies)
+    me, opponent = 'TheRealYzb25', f'opponent{generator.randrange(10000)}'
+    white, black = (me, opponent) if generator.random() < 0.5 else (opponent, me)
+    result = generator.choice(list(synthetic_terminations))
+    termination = generator.choice(synthetic_terminations[result]).format(white = white, black = black)
+    date = f'{generator.randint(2015, 2024)}.{generator.randint(1, 12):02}.{generator.randint(1, 28):02}'
+
+    headers = [('Event', 'Live Chess'), ('Site', 'Chess.com'), ('Date', date), ('Round', '?'), ('White', white), ('Black', black),
+               ('Result', result), ('ECO', f'{generator.choice("ABCDE")}{generator.randrange(100):02}'),
+               ('WhiteElo', str(generator.randint(400, 2400))), ('BlackElo', str(generator.randint(400, 2400))),
+               ('TimeControl', '600'), ('Termination', termination)]
+
+    numbered = [f'{ply // 2 + 1}. {move}' if ply % 2 == 0 else move for ply, move in enumerate(moves)]
+
+    return '\n'.join(f'[{tag} "{value}"]' for tag, value in headers) + '\n\n' + ' '.join(numbered) + f' {result}'
+
+
+
+def synthetic_corpus(games : int, seed : int = 0, plies : int = 60) -> list:
+    """Returns the given number of random games as PGN strings. The same seed always gives the same corpus."""
+
+    generator = random.Random(seed)
+    return [synthetic_pgn(generator, generator.randint(plies // 2, plies)) for _ in range(games)]
+
+
+
+def synthetic_repertoire(lines : int, seed : int = 0, plies : int = 16, breadth : int = 3) -> list:
+    """Returns the given number of random lines as Chess_moves, branching from a narrow tree of moves so they overlap like a repertoire."""
+
+    generator = random.Random(seed)
+    return [chess.Chess_moves(*random_line(generator, generator.randint(plies // 2, plies), breadth)) for _ in range(lines)]
+
+
+
+def time_operation(operation, count : int, repeats : int) -> dict:
+    """Times an operation performing count units of work, keeping the best of several runs to reduce noise."""
+
+    seconds = min(timeit.repeat(operation, number = 1, repeat = repeats))
+    return {'seconds' : seconds, 'count' : count, 'per_second' : count / seconds if seconds else None}
+
+
+
+def run_suite(games : int = 100, lines : int = 1000, seed : int = 0, repeats : int = 5) -> dict:
+    """Times each hot path on a synthetic corpus and repertoire of the given sizes, returning the results keyed by benchmark."""
+
+    corpus = synthetic_corpus(games, seed)
+    repertoire = synthetic_repertoire(lines, seed)
+    parsed = [chess.Chess_game(game) for game in corpus]
+
+    results = dict()
+    results['chess_game_parse'] = time_operation(lambda : [len(chess.Chess_game(game)) for game in corpus], len(corpus), repeats)
+
+    #Slices are taken at every length of each game, as the line space and book do when walking a line.
+    slices = [(game, ply) for game in parsed for ply in range(len(game) + 1)]
+    results['chess_moves_slice'] = time_operation(lambda : [game[:ply] for game, ply in slices], len(slices), repeats)
+
+    #Hashes are timed on fresh copies, so prefix hashes cached by an earlier run are not reused.
+    results['chess_moves_hash'] = time_operation(lambda : [hash(chess.Chess_moves(line)) for line in repertoire], len(repertoire), repeats)
+
+    copies = [chess.Chess_moves(line) for line in repertoire]
+    results['chess_moves_equality'] = time_operation(lambda : [line == copy for line, copy in zip(repertoire, copies)], len(repertoire), repeats)
+
+    def add_all():
+
+        space = chess.Line_space('bench', True, [])
+
+        for line in repertoire:
+            space.add(line)
+
+    results['line_space_add'] = time_operation(add_all, len(repertoire), repeats)
+
+    space = chess.Line_space('bench', True, repertoire)
+    prefixes = [line[:ply] for line in repertoire[:200] for ply in range(len(line) + 1)]
+    results['line_space_continuations'] = time_operation(lambda : [space.get_continuations(prefix) for prefix in prefixes], len(prefixes), repeats)
+
+    def discard_all():
+
+        copy = space.copy()
+
+        for line in repertoire:
+            copy.discard(line)
+
+    results['line_space_discard'] = time_operation(discard_all, len(repertoire), repeats)
+    results['unique_line_space_build'] = time_operation(lambda : chess.Unique_line_space('bench', True, repertoire, 4), len(repertoire), repeats)
+
+    #Half the lines are annotated, so lookups both hit and miss.
+    book = chess.Book('bench')
+
+    for line in repertoire[::2]:
+        book[line] = [chess.Annotation(line)]
+
+    results['book_contains'] = time_operation(lambda : [line in book for line in repertoire], len(repertoire), repeats)
+    results['book_annotations_along'] = time_operation(lambda : [book.annotations_along(line) for line in repertoire], len(repertoire), repeats)
+
+    return results
+
+
+
+def current_commit():
+    """Returns the hash of the checked out commit, or None outside a git repository."""
+
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output = True, text = True, check = True).stdout.strip()
+
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+
+def save_results(results : dict, path : str, **settings):
+    """Writes benchmark results to a JSON file, along with the settings, commit and interpreter they were measured with."""
+
+    report = {'commit' : current_commit(), 'python' : platform.python_version(), 'settings' : settings, 'results' : results}
+
+    with open(path, 'w') as file:
+        json.dump(report, file, indent = 2)
+
+
+
+def compare_results(baseline_path : str, current_path : str, tolerance : float = 0.1) -> list:
+    """Compares two saved benchmark reports, returning the names of benchmarks which became slower by more than the tolerance."""
+
+    with open(baseline_path) as file:
+        baseline = json.load(file)['results']
+
+    with open(current_path) as file:
+        current = json.load(file)['results']
+
+    regressions = []
+
+    for name in sorted(baseline.keys() & current.keys()):
+
+        ratio = current[name]['seconds'] / baseline[name]['seconds']
+        print(f'{name}: {ratio:.2f}x the baseline time.')
+
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+
+    return regressions
+
+
+
+
+
+#Run in a fresh interpreter, so nothing imported by the benchmark itself is already loaded. Prints the time each step took as JSON.
+startup_script = """
+import json, sys, time
+start = time.perf_counter()
+import chess
+imported = time.perf_counter()
+data = chess.Data_tree(sys.argv[1])
+opened = time.perf_counter()
+chess.Chess_moves('e4') in data.line_spaces['games']
+queried = time.perf_counter()
+data.games['0'].opponent_elo
+game_read = time.perf_counter()
+print(json.dumps({'import' : imported - start, 'open' : opened - imported, 'first_query' : queried - opened, 'first_game' : game_read - queried}))
+"""
+
+#Only times the import, so it also runs against revisions from before the store existed.
+import_script = """
+import json, time
+start = time.perf_counter()
+import chess
+print(json.dumps({'import' : time.perf_counter() - start}))
+"""
+
+
+
+def time_script(script : str, directory : str, repeats : int, *arguments) -> dict:
+    """Runs a timing script in a fresh interpreter from the given directory several times, keeping the best time of each step."""
+
+    runs = [json.loads(subprocess.run([sys.executable, '-c', script, *arguments], capture_output = True, text = True, check = True, cwd = directory).stdout)
+            for _ in range(repeats)]
+
+    return {step : min(run[step] for run in runs) for step in runs[0]}
+
+
+
+def export_revision(revision : str, directory : str):
+    """Writes the Python files of a git revision of this repository into a directory."""
+
+    git = lambda *arguments : subprocess.run(['git', *arguments], capture_output = True, check = True, cwd = os.path.dirname(os.path.abspath(__file__))).stdout
+
+    for name in git('ls-tree', '-r', '--name-only', revision).decode().splitlines():
+
+        if name.endswith('.py'):
+
+            path = os.path.join(directory, name)
+            os.makedirs(os.path.dirname(path), exist_ok = True)
+
+            with open(path, 'wb') as file:
+                file.write(git('show', f'{revision}:{name}'))
+
+
+
+def benchmark_startup(sizes : tuple = (50, 200, 800), seed : int = 0, repeats : int = 5, baseline : str = None, tolerance : float = 0.1) -> bool:
+    """Times importing chess, opening a store and its first queries in a fresh interpreter, for stores holding corpora of each size.
+
+    If given a baseline revision, the import is also timed at that revision. Returns whether it became slower than the baseline by more than the tolerance."""
+
+    corpus = synthetic_corpus(max(sizes), seed, plies = 40)
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = dict()
+
+    with tempfile.TemporaryDirectory() as directory:
+
+        for size in sizes:
+
+            path = os.path.join(directory, f'store{size}')
+            data = chess.Data_tree(path)
+            games = [chess.Chess_game(game) for game in corpus[:size]]
+
+            for number, game in enumerate(games):
+                data.games[str(number)] = game
+
+            data.line_spaces['games'] = chess.Line_space.from_games('games', True, games)
+            data.commit()
+            data.close()
+
+            results[size] = time_script(startup_script, here, repeats, path)
+            print(f'{size} games: ' + ', '.join(f'{step} {seconds * 1e3:.1f} ms' for step, seconds in results[size].items()) + '.')
+
+        if baseline is None:
+            return False
+
+        #Importing with no store open is timed for both, so the two are measured the same way.
+        export_revision(baseline, os.path.join(directory, 'baseline'))
+        current = time_script(import_script, here, repeats)['import']
+        previous = time_script(import_script, os.path.join(directory, 'baseline'), repeats)['import']
+
+    ratio = current / previous
+    print(f'Import: {current * 1e3:.1f} ms, against {previous * 1e3:.1f} ms at {baseline}, {ratio:.2f}x the baseline time.')
+
+    return ratio > 1 + tolerance
+
+
+
+
+
+if __name__ == '__main__':
+
+    #Usage: python benchmarks.py [results.json [baseline.json]]. Results are saved if a path is given, and compared against a baseline if one is given too.
+    #With no arguments, the import is compared against the revision named by STARTUP_BASELINE, if it is set.
+    if len(sys.argv) > 1:
+
+        settings = {'games' : 100, 'lines' : 1000, 'seed' : 0, 'repeats' : 5}
+        results = run_suite(**settings)
+        save_results(results, sys.argv[1], **settings)
+
+        for name, result in results.items():
+            print(f"{name}: {result['per_second']:,.0f} per second.")
+
+        if len(sys.argv) > 2:
+
+            regressions = compare_results(sys.argv[2], sys.argv[1])
+
+            if regressions:
+                print(f"Slower than the baseline: {', '.join(regressions)}.")
+                sys.exit(1)
+
+    else:
+        benchmark_tokenizer()
+        mismatches = benchmark_perft()
+        slower = benchmark_startup(baseline = os.environ.get('STARTUP_BASELINE'))
+
+        if slower:
+            print('Importing chess became slower than at the baseline revision.')
+
+        #Fast but wrong move generation is a failure, not a result.
+        if mismatches:
+            sys.exit(f'Move generation gave {len(mismatches)} incorrect perft results.')
+
+        if slower:
+            sys.exit(1)
@@ -0,0 +1,584 @@
+import re
+import random
+
+
+
+
+
+#Squares are numbered from 0 for a1 to 63 for h8. A bitboard is an integer with one bit set for each square it contains.
+files = 'abcdefgh'
+ranks = '12345678'
+
+white, black = 0, 1
+pawn, knight, bishop, rook, queen, king = range(6)
+piece_letters = 'PNBRQK'
+
+start_fen = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+#Matches a move in standard algebraic notation, once any check, mate or annotation symbols are taken off.
+san_pattern = re.compile(r'^([NBRQK])?([a-h])?([1-8])?(x)?([a-h][1-8])(?:=?([NBRQ]))?$')
+
+
+
+def square_name(square : int) -> str:
+
+    return files[square & 7] + ranks[square >> 3]
+
+
+
+def square_index(name : str) -> int:
+
+    return files.index(name[0]) + 8 * ranks.index(name[1])
+
+
+
+def squares_of(bitboard : int):
+    """Yields the index of each square set in a bitboard, lowest first."""
+
+    while bitboard:
+        lowest = bitboard & -bitboard
+        yield lowest.bit_length() - 1
+        bitboard ^= lowest
+
+
+
+def build_step_attacks(steps : list) -> list:
+    """Returns, for each square, the bitboard of squares reached by a single step in each of the given (file, rank) directions."""
+
+    table = []
+
+    for square in range(64):
+
+        attacks = 0
+
+        for file_step, rank_step in steps:
+
+            file, rank = (square & 7) + file_step, (square >> 3) + rank_step
+
+            if 0 <= file < 8 and 0 <= rank < 8:
+                attacks |= 1 << (file + 8 * rank)
+
+        table.append(attacks)
+
+    return table
+
+
+
+def build_rays(file_step : int, rank_step : int) -> list:
+    """Returns, for each square, the bitboard of squares from it to the edge of the board in the given direction."""
+
+    table = []
+
+    for square in range(64):
+
+        ray = 0
+        file, rank = (square & 7) + file_step, (square >> 3) + rank_step
+
+        while 0 <= file < 8 and 0 <= rank < 8:
+            ray |= 1 << (file + 8 * rank)
+            file, rank = file + file_step, rank + rank_step
+
+        table.append(ray)
+
+    return table
+
+
+
+knight_attacks = build_step_attacks([(1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)])
+king_attacks = build_step_attacks([(1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)])
+pawn_attacks = [build_step_attacks([(-1, 1), (1, 1)]), build_step_attacks([(-1, -1), (1, -1)])]
+
+
+#Each direction is paired with whether it runs towards higher squares. The nearest blocker on such a ray is its lowest set bit, and otherwise its highest.
+rook_rays = [(build_rays(1, 0), True), (build_rays(0, 1), True), (build_rays(-1, 0), False), (build_rays(0, -1), False)]
+bishop_rays = [(build_rays(1, 1), True), (build_rays(-1, 1), True), (build_rays(1, -1), False), (build_rays(-1, -1), False)]
+
+
+#Castling rights are bits in the order white king side, white queen side, black king side, black queen side. A move to or from a square clears the rights it names here.
+castling_letters = 'KQkq'
+castling_masks = [15] * 64
+castling_masks[4], castling_masks[7], castling_masks[0] = 15 ^ 3, 15 ^ 1, 15 ^ 2
+castling_masks[60], castling_masks[63], castling_masks[56] = 15 ^ 12, 15 ^ 4, 15 ^ 8
+
+
+
+#Zobrist keys give each piece on each square, each set of castling rights, each en passant file and the side to move a random number. A position's hash is the exclusive or of the keys describing it.
+zobrist_random = random.Random(20230322)
+piece_keys = [[[zobrist_random.getrandbits(64) for square in range(64)] for piece in range(6)] for colour in range(2)]
+castling_keys = [zobrist_random.getrandbits(64) for rights in range(16)]
+en_passant_keys = [zobrist_random.getrandbits(64) for file in range(8)]
+turn_key = zobrist_random.getrandbits(64)
+
+
+
+def slide_attacks(square : int, occupied : int, rays : list) -> int:
+    """Returns the squares attacked from a square along the given rays, stopping at the first occupied square on each."""
+
+    attacks = 0
+
+    for ray_table, towards_higher in rays:
+
+        ray = ray_table[square]
+        blockers = ray & occupied
+
+        if blockers:
+            blocker = (blockers & -blockers).bit_length() - 1 if towards_higher else blockers.bit_length() - 1
+            ray ^= ray_table[blocker]
+
+        attacks |= ray
+
+    return attacks
+
+
+
+
+
+class Chess_position:
+    """Object for holding a chess position as bitboards, with legal move generation and conversion of moves to and from algebraic notation.
+
+    Moves are (from square, to square, promotion piece) tuples, where the promotion piece is None for moves that do not promote."""
+
+    pieces : list
+    occupancy : list
+    board : list
+    turn : int
+    castling : int
+    en_passant : int
+    halfmove_clock : int
+    fullmove_number : int
+    history : list
+    zobrist : int
+
+
+    def __init__(self, fen : str = start_fen):
+
+        placement, turn, castling, en_passant, *clocks = fen.split()
+
+        self.pieces = [[0] * 6, [0] * 6]
+        self.occupancy = [0, 0]
+        self.board = [None] * 64
+        self.history = []
+        self.zobrist = 0
+
+        #FEN lists the ranks from the eighth down to the first.
+        for rank, row in enumerate(reversed(placement.split('/'))):
+
+            file = 0
+
+            for symbol in row:
+
+                if symbol.isdigit():
+                    file += int(symbol)
+                    continue
+
+                colour = white if symbol.isupper() else black
+                self.put(colour, piece_letters.index(symbol.upper()), file + 8 * rank)
+                file += 1
+
+        self.turn = white if turn == 'w' else black
+        self.castling = sum(1 << index for index, letter in enumerate(castling_letters) if letter in castling)
+        self.en_passant = None if en_passant == '-' else square_index(en_passant)
+        self.halfmove_clock, self.fullmove_number = (int(clocks[0]), int(clocks[1])) if len(clocks) == 2 else (0, 1)
+
+        #The pieces were hashed as they were put on the board, leaving the rest of the state to add.
+        self.zobrist ^= castling_keys[self.castling] ^ self.en_passant_key() ^ (turn_key if self.turn == black else 0)
+
+
+
+    def put(self, colour : int, piece : int, square : int):
+
+        bit = 1 << square
+        self.pieces[colour][piece] |= bit
+        self.occupancy[colour] |= bit
+        self.board[square] = (colour, piece)
+        self.zobrist ^= piece_keys[colour][piece][square]
+
+
+
+    def remove(self, square : int):
+
+        colour, piece = self.board[square]
+        bit = 1 << square
+        self.pieces[colour][piece] ^= bit
+        self.occupancy[colour] ^= bit
+        self.board[square] = None
+        self.zobrist ^= piece_keys[colour][piece][square]
+
+
+
+    def copy(self):
+        """Returns a copy of the position, without its history of moves."""
+
+        position = Chess_position.__new__(Chess_position)
+
+        position.pieces = [list(self.pieces[white]), list(self.pieces[black])]
+        position.occupancy = list(self.occupancy)
+        position.board = list(self.board)
+        position.history = []
+
+        position.turn, position.castling, position.en_passant = self.turn, self.castling, self.en_passant
+        position.halfmove_clock, position.fullmove_number, position.zobrist = self.halfmove_clock, self.fullmove_number, self.zobrist
+
+        return position
+
+
+
+    def en_passant_key(self) -> int:
+        """Returns the Zobrist key for the en passant square. It only counts if a pawn can actually capture there, so transpositions hash the same."""
+
+        if self.en_passant is None or not pawn_attacks[1 - self.turn][self.en_passant] & self.pieces[self.turn][pawn]:
+            return 0
+
+        return en_passant_keys[self.en_passant & 7]
+
+
+
+    def fen(self) -> str:
+        """Returns the position in Forsyth-Edwards Notation."""
+
+        rows = []
+
+        for rank in range(7, -1, -1):
+
+            row, empty = '', 0
+
+            for file in range(8):
+
+                occupant = self.board[file + 8 * rank]
+
+                if occupant is None:
+                    empty += 1
+                    continue
+
+                row += (str(empty) if empty else '') + (piece_letters[occupant[1]] if occupant[0] == white else piece_letters[occupant[1]].lower())
+                empty = 0
+
+            rows.append(row + (str(empty) if empty else ''))
+
+        castling = ''.join(letter for index, letter in enumerate(castling_letters) if self.castling >> index & 1) or '-'
+        en_passant = '-' if self.en_passant is None else square_name(self.en_passant)
+
+        return f"{'/'.join(rows)} {'wb'[self.turn]} {castling} {en_passant} {self.halfmove_clock} {self.fullmove_number}"
+
+
+
+    def is_attacked(self, square : int, by_colour : int) -> bool:
+        """Checks if any piece of the given colour attacks the square."""
+
+        pieces = self.pieces[by_colour]
+        occupied = self.occupancy[white] | self.occupancy[black]
+
+        return bool(knight_attacks[square] & pieces[knight]
+                    or pawn_attacks[1 - by_colour][square] & pieces[pawn]
+                    or king_attacks[square] & pieces[king]
+                    or slide_attacks(square, occupied, bishop_rays) & (pieces[bishop] | pieces[queen])
+                    or slide_attacks(square, occupied, rook_rays) & (pieces[rook] | pieces[queen]))
+
+
+
+    def in_check(self, colour : int = None) -> bool:
+        """Checks if the king of the given colour, by default the side to move, is attacked."""
+
+        colour = self.turn if colour is None else colour
+        return self.is_attacked(self.pieces[colour][king].bit_length() - 1, 1 - colour)
+
+
+
+    def pseudo_legal_moves(self) -> list:
+        """Returns every move for the side to move which obeys how the pieces move, whether or not it leaves the king in check."""
+
+        us, them = self.turn, 1 - self.turn
+        pieces = self.pieces[us]
+        own, enemy = self.occupancy[us], self.occupancy[them]
+        occupied = own | enemy
+        moves = []
+
+        #Pawns push forwards onto empty squares, and capture diagonally, including en passant.
+        forward = 8 if us == white else -8
+        start_rank, last_rank = (1, 7) if us == white else (6, 0)
+        capturable = enemy | (0 if self.en_passant is None else 1 << self.en_passant)
+
+        for square in squares_of(pieces[pawn]):
+
+            targets = pawn_attacks[us][square] & capturable
+            ahead = square + forward
+
+            if not occupied >> ahead & 1:
+                targets |= 1 << ahead
+
+                if square >> 3 == start_rank and not occupied >> (ahead + forward) & 1:
+                    targets |= 1 << (ahead + forward)
+
+            for target in squares_of(targets):
+
+                if target >> 3 == last_rank:
+                    moves.extend((square, target, promotion) for promotion in (queen, rook, bishop, knight))
+                else:
+                    moves.append((square, target, None))
+
+        for square in squares_of(pieces[knight]):
+            moves.extend((square, target, None) for target in squares_of(knight_attacks[square] & ~own))
+
+        for square in squares_of(pieces[bishop] | pieces[queen]):
+            moves.extend((square, target, None) for target in squares_of(slide_attacks(square, occupied, bishop_rays) & ~own))
+
+        for square in squares_of(pieces[rook] | pieces[queen]):
+            moves.extend((square, target, None) for target in squares_of(slide_attacks(square, occupied, rook_rays) & ~own))
+
+        for square in squares_of(pieces[king]):
+            moves.extend((square, target, None) for target in squares_of(king_attacks[square] & ~own))
+
+        #The king may not castle out of or through check. Landing in check is caught with every other move when checking legality.
+        home = 0 if us == white else 56
+        king_side, queen_side = (1, 2) if us == white else (4, 8)
+
+        if self.castling & king_side and not occupied & (0b01100000 << home) and not self.is_attacked(home + 4, them) and not self.is_attacked(home + 5, them):
+            moves.append((home + 4, home + 6, None))
+
+        if self.castling & queen_side and not occupied & (0b00001110 << home) and not self.is_attacked(home + 4, them) and not self.is_attacked(home + 3, them):
+            moves.append((home + 4, home + 2, None))
+
+        return moves
+
+
+
+    def make_move(self, move : tuple):
+        """Plays a move, which is assumed to be at least pseudo-legal. It can be taken back with unmake_move."""
+
+        origin, target, promotion = move
+        colour, piece = self.board[origin]
+
+        #An en passant capture takes the pawn beside the target square rather than on it.
+        captured_square = target
+
+        if piece == pawn and target == self.en_passant:
+            captured_square = target - 8 if colour == white else target + 8
+
+        captured = self.board[captured_square]
+        self.history.append((move, captured, captured_square, self.castling, self.en_passant, self.halfmove_clock, self.zobrist))
+        self.zobrist ^= castling_keys[self.castling] ^ self.en_passant_key()
+
+        if captured is not None:
+            self.remove(captured_square)
+
+        self.remove(origin)
+        self.put(colour, piece if promotion is None else promotion, target)
+
+        #Castling is a king move of two squares, which brings the rook to the square the king passed over.
+        if piece == king and abs(target - origin) == 2:
+            rook_origin, rook_target = (origin + 3, origin + 1) if target > origin else (origin - 4, origin - 1)
+            self.remove(rook_origin)
+            self.put(colour, rook, rook_target)
+
+        self.castling &= castling_masks[origin] & castling_masks[target]
+        self.en_passant = (origin + target) // 2 if piece == pawn and abs(target - origin) == 16 else None
+        self.halfmove_clock = 0 if piece == pawn or captured is not None else self.halfmove_clock + 1
+        self.fullmove_number += colour
+        self.turn = 1 - colour
+        self.zobrist ^= castling_keys[self.castling] ^ self.en_passant_key() ^ turn_key
+
+
+
+    def unmake_move(self):
+        """Takes back the last move played."""
+
+        (origin, target, promotion), captured, captured_square, self.castling, self.en_passant, self.halfmove_clock, zobrist = self.history.pop()
+
+        colour = 1 - self.turn
+        piece = pawn if promotion is not None else self.board[target][1]
+
+        self.remove(target)
+        self.put(colour, piece, origin)
+
+        if captured is not None:
+            self.put(captured[0], captured[1], captured_square)
+
+        if piece == king and abs(target - origin) == 2:
+            rook_origin, rook_target = (origin + 3, origin + 1) if target > origin else (origin - 4, origin - 1)
+            self.remove(rook_target)
+            self.put(colour, rook, rook_origin)
+
+        self.fullmove_number -= colour
+        self.turn = colour
+        self.zobrist = zobrist
+
+
+
+    def legal_moves(self) -> list:
+        """Returns every legal move for the side to move."""
+
+        moves = []
+        mover = self.turn
+
+        for move in self.pseudo_legal_moves():
+
+            self.make_move(move)
+
+            if not self.in_check(mover):
+                moves.append(move)
+
+            self.unmake_move()
+
+        return moves
+
+
+
+    def san(self, move : tuple) -> str:
+        """Returns a legal move in standard algebraic notation."""
+
+        origin, target, promotion = move
+        piece = self.board[origin][1]
+
+        if piece == king and abs(target - origin) == 2:
+            text = 'O-O' if target > origin else 'O-O-O'
+
+        else:
+
+            is_capture = self.board[target] is not None or (piece == pawn and target == self.en_passant)
+            text = '' if piece == pawn else piece_letters[piece]
+
+            #Pieces are told apart by file where possible, then by rank, then by both.
+            if piece == pawn:
+                text += files[origin & 7] if is_capture else ''
+
+            else:
+
+                rivals = [other for other, other_target, _ in self.legal_moves() if other_target == target and other != origin and self.board[other][1] == piece]
+
+                if rivals:
+
+                    if all(other & 7 != origin & 7 for other in rivals):
+                        text += files[origin & 7]
+
+                    elif all(other >> 3 != origin >> 3 for other in rivals):
+                        text += ranks[origin >> 3]
+
+                    else:
+                        text += square_name(origin)
+
+            text += ('x' if is_capture else '') + square_name(target) + ('' if promotion is None else '=' + piece_letters[promotion])
+
+        self.make_move(move)
+
+        if self.in_check():
+            text += '#' if not self.legal_moves() else '+'
+
+        self.unmake_move()
+        return text
+
+
+
+    def parse_san(self, san : str) -> tuple:
+        """Returns the legal move described by a move in standard algebraic notation. Raises ValueError if it is illegal or ambiguous."""
+
+        text = san.rstrip('+#!?')
+        legal_moves = self.legal_moves()
+
+        if text in ('O-O', 'O-O-O', '0-0', '0-0-0'):
+
+            home = 0 if self.turn == white else 56
+            castle = (home + 4, home + 6 if len(text) == 3 else home + 2, None)
+
+            if castle in legal_moves and self.board[home + 4] == (self.turn, king):
+                return castle
+
+            raise ValueError(f'Move {san} is not legal in this position.')
+
+        match = san_pattern.match(text)
+
+        if match is None:
+            raise ValueError(f'Move {san} is not in algebraic notation.')
+
+        letter, from_file, from_rank, capture, target, promotion = match.groups()
+        piece = pawn if letter is None else piece_letters.index(letter)
+        target = square_index(target)
+        promotion = None if promotion is None else piece_letters.index(promotion)
+        is_capture = self.board[target] is not None or (piece == pawn and target == self.en_passant)
+
+        #A capture must be written with an 'x', and a move written with one must capture.
+        if bool(capture) != is_capture:
+            raise ValueError(f"Move {san} {'does not capture' if capture else 'captures without an x'} in this position.")
+
+        #Pawn captures are written with the file they leave, as in 'dxe5', and pawn pushes stay on their file.
+        if piece == pawn and (from_rank is not None or (from_file is None) == is_capture):
+            raise ValueError(f'Move {san} is not a valid pawn move.')
+
+        #Kings castle only when written as 'O-O' or 'O-O-O'.
+        candidates = [move for move in legal_moves if move[1] == target and move[2] == promotion and self.board[move[0]][1] == piece
+                      and (from_file is None or files[move[0] & 7] == from_file) and (from_rank is None or ranks[move[0] >> 3] == from_rank)
+                      and not (piece == king and abs(move[1] - move[0]) == 2)]
+
+        if len(candidates) != 1:
+            raise ValueError(f"Move {san} is {'ambiguous' if candidates else 'not legal'} in this position.")
+
+        return candidates[0]
+
+
+
+    def push_san(self, san : str) -> tuple:
+        """Plays a move given in standard algebraic notation, returning it."""
+
+        move = self.parse_san(san)
+        self.make_move(move)
+        return move
+
+
+
+    def perft(self, depth : int) -> int:
+        """Counts the leaf nodes of the tree of legal moves to the given depth, for checking move generation against known values."""
+
+        if depth == 0:
+            return 1
+
+        moves = self.legal_moves()
+
+        if depth == 1:
+            return len(moves)
+
+        nodes = 0
+
+        for move in moves:
+            self.make_move(move)
+            nodes += self.perft(depth - 1)
+            self.unmake_move()
+
+        return nodes
+
+
+
+
+
+def replay(moves, fen : str = start_fen) -> Chess_position:
+    """Plays a sequence of moves in algebraic notation from a position, returning the final position. Raises ValueError at the first illegal move."""
+
+    position = Chess_position(fen)
+
+    for ply, move in enumerate(moves):
+
+        try:
+            position.push_san(move)
+
+        except ValueError as error:
+            raise ValueError(f'Ply {ply + 1}: {error}') from None
+
+    return position
+
+
+
+def zobrist_hashes(moves, fen : str = start_fen) -> list:
+    """Plays a sequence of moves in algebraic notation, returning the Zobrist hash of the position before any moves and after each one."""
+
+    position = Chess_position(fen)
+    hashes = [position.zobrist]
+
+    for ply, move in enumerate(moves):
+
+        try:
+            position.push_san(move)
+
+        except ValueError as error:
+            raise ValueError(f'Ply {ply + 1}: {error}') from None
+
+        hashes.append(position.zobrist)
+
+    return hashes
@@ -1,8 +1,17 @@
-import pickle
+from __future__ import annotations
+import array
+import collections
 import collections.abc
 import datetime
+import os
+import re
+import itertools
+import bisect
+import sys
 import metadata
 
+#The board, the store and the modules only needed by a few operations are imported where they are used, so importing this module stays quick.
+
 
 
 
@@ -27,6 +36,13 @@ def check_is_move(move : str) -> bool:
     #Take out notation for captures, checks and checkmates.
     move = ''.join( [char for char in move if char not in {'#', '+'}] )
 
+    #Take out a promotion, as in 'e8=Q', so the square the pawn lands on is checked below.
+    if len(move) > 2 and move[-2] == '=' and move[-1] in {'Q', 'R', 'B', 'N'}:
+        move = move[:-2]
+
+    if len(move) < 2:
+        return False
+
     #Check if the back ends with a valid coordinate (i.e. 'h2', 'a4', etc.).
     if ord(move[-2]) not in range(97, 105) or ord(move[-1]) not in range(49, 57):
         return False
@@ -49,6 +65,21 @@ def check_is_move_and_warn(move : str) -> bool:
 
 
 
+def check_is_legal_and_warn(moves) -> bool:
+    """Replays a sequence of moves on a board to ensure each is legal from the starting position. Warns if one is not."""
+
+    import board
+
+    try:
+        board.replay(moves)
+        return True
+
+    except ValueError as error:
+        print(f'Moves are not legal. {error}')
+        return False
+
+
+
 def split_string_list(string_list : list, *separators):
     """Splits a list of strings into a larger list of strings using the given separators."""
 
@@ -70,70 +101,344 @@ def split_string_list(string_list : list, *separators):
 
 
 
+#Regular expressions for the parts of a PGN. A move must stand alone, and may be followed by annotation symbols like '!?'.
+pgn_header_regex = r'\[ \s* (?P<tag>\w+) \s+ "(?P<value>[^"]*)" \s* \]'
+pgn_move_regex = r'(?<![\w-]) (?P<move> O-O(?:-O)?[+#]? | [KQRBN][a-h]?[1-8]?x?[a-h][1-8][+#]? | [a-h](?:x[a-h])?[1-8](?:=[QRBN])?[+#]? ) [!?]* (?![\w=-])'
+
+
+#Matches the run of headers at the start of a PGN, so the movetext is known to begin where it ends. Comments in the movetext may hold brackets, as in '{ [%clk 0:03:00] }'.
+pgn_header_block_regex = r'(?:\s*\[\s*\w+\s+"[^"]*"\s*\])*'
+
+
+#Matches a single PGN token. Each alternative is named after the kind of token it matches, and results are tried before move numbers so '1-0' is not read as move one.
+pgn_token_regex = rf"""
+    (?P<header> {pgn_header_regex} )
+  | (?P<comment> \{{[^}}]*\}} | ;[^\n]* )
+  | (?P<variation_start> \( )
+  | (?P<variation_end> \) )
+  | (?P<result> 1-0 | 0-1 | 1/2-1/2 | \* )
+  | (?P<move_number> \d+\.(?:\.\.)? )
+  | (?P<nag> \$\d+ )
+  | {pgn_move_regex}
+"""
+
+
+#Patterns are compiled the first time they are used, so importing the module compiles none of them. Each source is given with its flags.
+pattern_sources : dict = {'header_text' : (pgn_header_regex, re.VERBOSE), 'move' : (pgn_move_regex, re.VERBOSE), 'token' : (pgn_token_regex, re.VERBOSE),
+                          'header_block' : (pgn_header_block_regex, 0), 'header_block_bytes' : (pgn_header_block_regex.encode(), 0)}
+compiled_patterns : dict = dict()
+
+
+
+def compiled(name : str) -> re.Pattern:
+    """Returns the named pattern, compiling it on first use."""
+
+    pattern = compiled_patterns.get(name)
+
+    if pattern is None:
+        source, flags = pattern_sources[name]
+        pattern = compiled_patterns[name] = re.compile(source, flags)
+
+    return pattern
+
+
+
+def tokenize_pgn(pgn : str):
+    """Yields (kind, value) pairs for each token of a PGN string in a single pass. Headers yield (tag, value) pairs as their value.
+    
+    Kinds are 'header', 'comment', 'variation_start', 'variation_end', 'result', 'move_number', 'nag' and 'move'. Anything else is skipped."""
+
+    for match in compiled('token').finditer(pgn):
+
+        kind = match.lastgroup
+
+        if kind == 'header':
+            yield kind, (match.group('tag'), match.group('value'))
+
+        else:
+            yield kind, match.group(kind)
+
+
+
+def header_block_end(pgn) -> int:
+    """Returns the index at which the headers at the start of a PGN, given as a string or as bytes, end and the movetext begins."""
+
+    pattern = compiled('header_block_bytes' if isinstance(pgn, (bytes, bytearray)) else 'header_block')
+    return pattern.match(pgn).end()
+
+
+
+def parse_pgn(pgn : str):
+    """Reads a PGN string in a single pass, returning a dictionary of its headers and a list of its main line moves. Moves in variations are left out."""
+
+    #Movetext without comments or variations is the common case, and its moves can be collected in one call.
+    movetext = pgn[header_block_end(pgn):]
+
+    if not any(symbol in movetext for symbol in '{};()'):
+        return dict(compiled('header_text').findall(pgn)), compiled('move').findall(movetext)
+
+    headers = dict()
+    moves = []
+    depth = 0
+
+    for match in compiled('token').finditer(pgn):
+
+        kind = match.lastgroup
+
+        if kind == 'move':
+            if depth == 0:
+                moves.append(match.group('move'))
+
+        elif kind == 'header':
+            headers[match.group('tag')] = match.group('value')
+
+        elif kind == 'variation_start':
+            depth += 1
+
+        elif kind == 'variation_end':
+            depth = max(depth - 1, 0)
+
+    return headers, moves
+
+
+
+
+
+#Every distinct move is interned as a small integer, so move sequences can be stored as compact arrays of codes.
+move_tokens : dict = dict()
+move_names : list = []
+
+
+
+def encode_move(move : str) -> int:
+    """Returns the interned code for a move, assigning a new code if the move has not been seen before."""
+
+    code = move_tokens.get(move)
+
+    if code is None:
+        code = move_tokens[move] = len(move_names)
+        move_names.append(move)
+
+    return code
+
+
+
+def decode_move(code : int) -> str:
+    """Returns the move corresponding to an interned code."""
+
+    return move_names[code]
+
+
+
+#Move sequences are hashed with a polynomial rolling hash, so the hash of any slice can be derived from the hashes of prefixes.
+hash_modulus : int = (1 << 61) - 1
+hash_base : int = 1_000_000_007
+hash_powers : list = [1]
+
+
+
+def hash_power(exponent : int) -> int:
+    """Returns the hash base raised to the given exponent, modulo the hash modulus."""
+
+    while len(hash_powers) <= exponent:
+        hash_powers.append(hash_powers[-1] * hash_base % hash_modulus)
+
+    return hash_powers[exponent]
+
+
+
+
+
 class Chess_moves(collections.abc.MutableSequence):
     """Object for holding and manipulating sequences of chess moves."""
 
-    list_of_moves = []
+    __slots__ = ('move_codes', 'shared', 'prefix_hashes')
+
+    move_codes : array.array
+    shared : bool
+    prefix_hashes : list
+
+    #If set, moves added by add_move, insert and item assignment are also checked for legality by replaying them on a board.
+    validate_legality : bool = False
 
     
     def __init__(self, *moves_in_algebraic_notation : str):
         """Initializer can be initialized with one string of moves or multiple. Initializer can directly accept strings of unformatted PGN from Chess.com."""
 
-        formatted_move_sequence : list = split_string_list(moves_in_algebraic_notation, ',', ' ', '\n', '\r')
-        self.list_of_moves = [move for move in formatted_move_sequence if check_is_move(move)]
+        self.shared = False
+        self.prefix_hashes = None
+
+        #Copying another sequence of moves needs no re-parsing, as its moves have already been checked.
+        if len(moves_in_algebraic_notation) == 1 and isinstance(moves_in_algebraic_notation[0], Chess_moves):
+            self.move_codes = array.array('H', moves_in_algebraic_notation[0].code_bytes())
+            return
+
+        #Each string is tokenized in a single pass, keeping only the moves of its main line.
+        self.move_codes = array.array('H', [encode_move(move) for moves in moves_in_algebraic_notation for move in parse_pgn(moves)[1]])
+
+
+
+    @classmethod
+    def from_codes(cls, move_codes : array.array):
+        """Builds a Chess_moves directly from an array of interned move codes, skipping parsing."""
+
+        moves = Chess_moves.__new__(Chess_moves)
+        moves.move_codes = move_codes
+        moves.shared = False
+        moves.prefix_hashes = None
+        return moves
+
+
+
+    @property
+    def list_of_moves(self):
+        """The moves as a list of strings in algebraic notation."""
+
+        return [move_names[code] for code in self.move_codes]
+
+
+
+    def code_bytes(self) -> bytes:
+        """Returns the interned codes of the moves as bytes, for fast hashing and comparison."""
+
+        return self.move_codes.tobytes()
+
+
+
+    def code_range(self):
+        """Returns the start and stop indices of the moves within their array of codes."""
+
+        return 0, len(self.move_codes)
+
+
+
+    def ensure_prefix_hashes(self, stop : int) -> list:
+        """Returns the rolling hashes of the prefixes of the array of codes, computing any missing up to the given index.
+        
+        The list of hashes is only ever extended in place, so slices sharing the array can share the list."""
+
+        if self.prefix_hashes is None:
+            self.prefix_hashes = [0]
+
+        hashes = self.prefix_hashes
+        prefix_hash = hashes[-1]
+
+        for code in self.move_codes[len(hashes) - 1 : stop]:
+            prefix_hash = (prefix_hash * hash_base + code + 1) % hash_modulus
+            hashes.append(prefix_hash)
+
+        return hashes
+
+
+
+    def unshare(self):
+        """Gives the sequence its own copy of its moves if slices are sharing them, so mutating it leaves the slices untouched."""
+
+        if self.shared:
+            self.move_codes = array.array('H', self.move_codes)
+            self.shared = False
 
 
     
     def __getitem__(self, key):
         """Extends standard list behaviour to Chess_moves."""
 
-        #If key is numeric, subscribing the list should yield a single move, necessitating the substitution of a single argument into the Chess_moves initializer.
-        try:
-            assert(check_is_move(self.list_of_moves[key]))
-            return self.list_of_moves[key]
-        
-        #Otherwise, the key is a slice. And the list will yield multiple moves for multiple arguments.
-        except:
-            return Chess_moves(*self.list_of_moves[key])
+        #If the key is a slice, the list will yield multiple moves. Contiguous slices are returned as views sharing these moves.
+        if isinstance(key, slice):
+
+            if key.step not in (None, 1):
+                return Chess_moves.from_codes(self.move_codes[key])
+
+            start, stop, _ = key.indices(len(self.move_codes))
+            self.shared = True
+
+            #Hashing the whole sequence once lets every slice of it be hashed in constant time.
+            return Chess_moves_view(self.move_codes, start, max(start, stop), self.ensure_prefix_hashes(len(self.move_codes)))
+
+        #Otherwise, subscribing the list should yield a single move.
+        return move_names[self.move_codes[key]]
 
 
 
     def __setitem__(self, key, value):
         """Extends standard list behaviour to Chess_moves."""
 
+        self.unshare()
+
         #If the value is multiple moves, a check will need to be performed on each move to ensure it's formatted.
-        if not hasattr(value, '__iter__'):
+        if isinstance(value, str):
             if check_is_move_and_warn(value):
-                self.list_of_moves[key] = value
+
+                if self.validate_legality:
+                    candidate = self.list_of_moves
+                    candidate[key] = value
+
+                    if not check_is_legal_and_warn(candidate):
+                        return
+
+                self.move_codes[key] = encode_move(value)
+                self.prefix_hashes = None
                 
         else:
             if all(check_is_move_and_warn(move) for move in value):
-                self.list_of_moves[key] = value
+
+                if self.validate_legality:
+                    candidate = self.list_of_moves
+                    candidate[key] = list(value)
+
+                    if not check_is_legal_and_warn(candidate):
+                        return
+
+                self.move_codes[key] = array.array('H', [encode_move(move) for move in value])
+                self.prefix_hashes = None
 
 
     
     def __delitem__(self, key):
         """Extends standard list behaviour to Chess_moves."""
 
-        del self.list_of_moves[key]
+        self.unshare()
+        del self.move_codes[key]
+        self.prefix_hashes = None
 
 
 
     def __len__(self):
         """Extends standard list behaviour to Chess_moves."""
 
-        return len(self.list_of_moves)
+        return len(self.move_codes)
+
+
+
+    def __iter__(self):
+        """Extends standard list behaviour to Chess_moves."""
+
+        return (move_names[code] for code in self.move_codes)
     
 
 
     def insert(self, index, value):
 
         if check_is_move_and_warn(value):
-            self.list_of_moves.insert(index, value)
+
+            if self.validate_legality:
+                candidate = self.list_of_moves
+                candidate.insert(index, value)
+
+                if not check_is_legal_and_warn(candidate):
+                    return
+
+            self.unshare()
+            self.move_codes.insert(index, encode_move(value))
+            self.prefix_hashes = None
     
 
 
     def __eq__(self, other):
+
+        #Sequences of interned moves can be compared code by code.
+        if isinstance(other, Chess_moves):
+            return len(self) == len(other) and self.code_bytes() == other.code_bytes()
         
         try:
             assert(len(other) == len(self))
@@ -151,11 +456,13 @@ class Chess_moves(collections.abc.MutableSequence):
     def __str__(self):
         """Ensures print and other str operations return the moves rather than the memory address."""
 
+        list_of_moves = self.list_of_moves
+
         #Separate case for empty list
-        if self.list_of_moves == []: return ('1. ')
+        if list_of_moves == []: return ('1. ')
 
         #Split the moves into white moves and black moves then combine them by turn.
-        white, black = self.list_of_moves[0::2], self.list_of_moves[1::2]
+        white, black = list_of_moves[0::2], list_of_moves[1::2]
         turns = [f'{white[turn]} ' + f'{black[turn]}' if turn < len(black) \
                  else f'{white[turn]}' for turn in range(len(white))]
         
@@ -166,19 +473,202 @@ class Chess_moves(collections.abc.MutableSequence):
 
 
     def __hash__(self):
-        return hash(tuple(self.list_of_moves))
+
+        #The hash of the moves between start and stop is derived from the hashes of the prefixes ending at each.
+        start, stop = self.code_range()
+        hashes = self.ensure_prefix_hashes(stop)
+        return (hashes[stop] - hashes[start] * hash_power(stop - start)) % hash_modulus
+
+
+
+    def __getstate__(self):
+        """Pickles moves by name, as interned codes are only meaningful within the current process."""
+
+        state = dict(getattr(self, '__dict__', {}))
+        state['list_of_moves'] = self.list_of_moves
+        return state
+
+
+
+    def __setstate__(self, state):
+
+        state = dict(state)
+        self.move_codes = array.array('H', [encode_move(move) for move in state.pop('list_of_moves')])
+        self.shared = False
+        self.prefix_hashes = None
+
+        for attribute, value in state.items():
+            setattr(self, attribute, value)
 
 
     
     def add_move(self, *moves : str):
         """Adds moves specified in the argument."""
 
+        #When checking legality, the current position is built once and each new move is played onto it.
+        position = None
+
+        if self.validate_legality:
+
+            import board
+
+            try:
+                position = board.replay(self)
+
+            except ValueError as error:
+                print(f'Moves are not legal. {error}')
+                return
+
         for move in moves:
 
             if not check_is_move_and_warn(move):
                 return
+
+            if position is not None:
+
+                try:
+                    position.push_san(move)
+
+                except ValueError as error:
+                    print(error)
+                    return
             
-            self.list_of_moves.append(move)
+            self.unshare()
+            self.move_codes.append(encode_move(move))
+
+
+
+
+
+class Chess_moves_view(Chess_moves):
+    """Object for reading a contiguous slice of a sequence of chess moves without copying it. The moves are only copied if the view is mutated."""
+
+    __slots__ = ('start', 'stop')
+
+    start : int
+    stop : int
+
+
+    def __init__(self, move_codes : array.array, start : int, stop : int, prefix_hashes : list = None):
+
+        #The moves and their prefix hashes belong to the sliced sequence, so they count as shared until the view is mutated.
+        self.move_codes = move_codes
+        self.shared = True
+        self.prefix_hashes = prefix_hashes
+        self.start = start
+        self.stop = stop
+
+
+
+    @property
+    def list_of_moves(self):
+        """The moves as a list of strings in algebraic notation."""
+
+        return [move_names[code] for code in self.move_codes[self.start:self.stop]]
+
+
+
+    def code_bytes(self) -> bytes:
+        """Returns the interned codes of the moves as bytes, for fast hashing and comparison."""
+
+        return memoryview(self.move_codes)[self.start:self.stop].tobytes()
+
+
+
+    def code_range(self):
+        """Returns the start and stop indices of the moves within their array of codes."""
+
+        return self.start, self.stop
+
+
+
+    def unshare(self):
+        """Copies the viewed moves into the view's own storage, so it can be mutated without affecting the sliced sequence."""
+
+        if self.shared:
+
+            #Prefix hashes can only be kept if the view starts at the front of the array. The shared list may extend past the view, so it is cut short.
+            if self.prefix_hashes is not None and self.start == 0:
+                self.prefix_hashes = self.prefix_hashes[:self.stop + 1]
+            else:
+                self.prefix_hashes = None
+
+            self.move_codes = self.move_codes[self.start:self.stop]
+            self.shared = False
+            self.start, self.stop = 0, len(self.move_codes)
+
+
+
+    def __getitem__(self, key):
+        """Extends standard list behaviour to Chess_moves."""
+
+        indices = range(self.start, self.stop)[key]
+
+        if not isinstance(key, slice):
+            return move_names[self.move_codes[indices]]
+
+        #Contiguous slices of a view are views of the same moves.
+        if indices.step == 1:
+            self.shared = True
+            return Chess_moves_view(self.move_codes, indices.start, max(indices.start, indices.stop), self.ensure_prefix_hashes(self.stop))
+
+        return Chess_moves.from_codes(array.array('H', [self.move_codes[index] for index in indices]))
+
+
+
+    def __setitem__(self, key, value):
+        """Extends standard list behaviour to Chess_moves."""
+
+        self.unshare()
+        super().__setitem__(key, value)
+        self.stop = len(self.move_codes)
+
+
+
+    def __delitem__(self, key):
+        """Extends standard list behaviour to Chess_moves."""
+
+        self.unshare()
+        super().__delitem__(key)
+        self.stop = len(self.move_codes)
+
+
+
+    def __len__(self):
+        """Extends standard list behaviour to Chess_moves."""
+
+        return self.stop - self.start
+
+
+
+    def __iter__(self):
+        """Extends standard list behaviour to Chess_moves."""
+
+        return (move_names[self.move_codes[index]] for index in range(self.start, self.stop))
+
+
+
+    def insert(self, index, value):
+
+        self.unshare()
+        super().insert(index, value)
+        self.stop = len(self.move_codes)
+
+
+
+    def __reduce__(self):
+        """Pickles the view as an ordinary sequence of moves."""
+
+        return Chess_moves, tuple(self.list_of_moves)
+
+
+
+    def add_move(self, *moves : str):
+        """Adds moves specified in the argument."""
+
+        self.unshare()
+        super().add_move(*moves)
+        self.stop = len(self.move_codes)
 
 
 
@@ -212,371 +702,2555 @@ class Log():
 class Annotation(Chess_moves):
     """Object for holding notes about a particular sequence of chess moves."""
 
-    notes : list
+    notes : list
+
+    #The note index kept up to date as notes are added, if the annotation is watched by one.
+    index = None
+
+
+    def __init__(self, moves_to_annotate : Chess_moves):
+
+        super().__init__(moves_to_annotate)
+        self.notes = []
+    
+
+
+    def __str__(self):
+
+        output = ''
+
+        for note in self.notes:
+
+            output += f'{str(note)} \n\n'
+
+
+
+    def __getstate__(self):
+
+        #The index is shared between many annotations, so it is not pickled with each of them.
+        state = super().__getstate__()
+        state.pop('index', None)
+        return state
+
+
+
+    def add_note(self, note : str):
+
+        if self.notes and self.notes[-1].entry['date'] == datetime.datetime.now().date():
+            self.notes[-1].entry['content'] += '\n\n' + note
+
+        else:
+            self.notes.append(Log(note))
+
+        if self.index is not None:
+            self.index.add_text(self, self.notes[-1], note)
+
+
+
+
+
+#Matches a single word of a note. Words are compared in lower case.
+pattern_sources['note_term'] = (r'[a-z0-9]+', 0)
+
+
+
+class Note_index:
+    """Object for holding an inverted index of the words in the notes of many annotations, for term and phrase searches.
+
+    Each Log is indexed as a document. Annotations are indexed when watched, and kept up to date as notes are added to them.
+    Annotations added to a watched book are watched as they are added."""
+
+    documents : list
+    postings : dict
+    dates : list
+    document_ids : dict
+
+
+    def __init__(self, annotations = ()):
+
+        #Each document is an (annotation, log, word count) list, or None once forgotten.
+        self.documents = []
+
+        #The positions of each word within each document containing it, keyed by word then document.
+        self.postings = dict()
+
+        #Sorted (date ordinal, document) pairs, so documents written between two dates lie next to each other.
+        self.dates = []
+
+        #The document of each log, keyed by the log's id.
+        self.document_ids = dict()
+
+        for annotation in annotations:
+            self.watch(annotation)
+
+
+
+    def watch(self, annotation : Annotation):
+        """Indexes the notes of an annotation, and keeps them indexed as more are added."""
+
+        annotation.index = self
+
+        for log in annotation.notes:
+            if id(log) not in self.document_ids:
+                self.add_text(annotation, log, log.entry['content'])
+
+
+
+    def add_book(self, book):
+        """Watches every annotation held in a book, and every annotation added to it from now on."""
+
+        book.index = self
+
+        for annotation_key, value in book.annotations.items():
+
+            if isinstance(value, list):
+                book.annotations[annotation_key] = book.watched(value)
+
+            elif isinstance(value, Annotation):
+                self.watch(value)
+
+
+
+    def add_text(self, annotation : Annotation, log : Log, text : str):
+        """Indexes text added to a log, which continues on from any text of the log already indexed."""
+
+        document = self.document_ids.get(id(log))
+
+        if document is None:
+            document = self.document_ids[id(log)] = len(self.documents)
+            self.documents.append([annotation, log, 0])
+            bisect.insort(self.dates, (log.entry['date'].toordinal(), document))
+
+        offset = self.documents[document][2]
+        words = compiled('note_term').findall(text.lower())
+
+        for position, word in enumerate(words, start = offset):
+            self.postings.setdefault(word, dict()).setdefault(document, []).append(position)
+
+        self.documents[document][2] = offset + len(words)
+
+
+
+    def forget(self, annotation : Annotation):
+        """Removes the notes of an annotation from the index, and stops watching it."""
+
+        annotation.index = None
+
+        for log in annotation.notes:
+
+            document = self.document_ids.pop(id(log), None)
+
+            if document is None:
+                continue
+
+            for word in set(compiled('note_term').findall(log.entry['content'].lower())):
+
+                self.postings[word].pop(document, None)
+
+                if not self.postings[word]:
+                    del self.postings[word]
+
+            self.dates.remove((log.entry['date'].toordinal(), document))
+            self.documents[document] = None
+
+
+
+    def search(self, query : str, phrase : bool = False, start : datetime.date = None, end : datetime.date = None) -> list:
+        """Returns (line, date) pairs for each note containing every word of the query, or the query as a phrase, sorted by date.
+
+        Notes may be restricted to those written between two dates, inclusive. Either end may be left open."""
+
+        words = compiled('note_term').findall(query.lower())
+
+        if not words:
+            return []
+
+        #Candidates are narrowed from the rarest word outwards.
+        postings = [self.postings.get(word, {}) for word in words]
+        candidates = set(min(postings, key = len))
+
+        for word_postings in postings:
+            candidates.intersection_update(word_postings)
+
+        if phrase:
+            candidates = {document for document in candidates if self.contains_phrase(document, postings)}
+
+        if start is not None or end is not None:
+            low = bisect.bisect_left(self.dates, (start.toordinal(),)) if start is not None else 0
+            high = bisect.bisect_left(self.dates, (end.toordinal() + 1,)) if end is not None else len(self.dates)
+            candidates.intersection_update(document for _, document in self.dates[low:high])
+
+        found = [self.documents[document] for document in candidates]
+        found.sort(key = lambda entry : entry[1].entry['date'])
+
+        return [(Chess_moves(annotation), log.entry['date']) for annotation, log, _ in found]
+
+
+
+    def contains_phrase(self, document : int, postings : list) -> bool:
+        """Checks the words whose postings are given appear one after another somewhere in the document."""
+
+        later_positions = [set(word_postings[document]) for word_postings in postings[1:]]
+
+        return any(all(position + distance in positions for distance, positions in enumerate(later_positions, start = 1))
+                   for position in postings[0][document])
+
+
+
+
+
+class Annotation_list(list):
+    """List of the annotations a book holds on a line. If the book is watched by a note index, annotations added to the list are watched too.
+
+    Pickles as a plain list, so stored books are unaffected."""
+
+    #The note index of the book holding the list, if it is watched by one.
+    index = None
+
+
+    def watch(self, annotations):
+
+        if self.index is not None:
+            for annotation in annotations:
+                if isinstance(annotation, Annotation):
+                    self.index.watch(annotation)
+
+
+
+    def append(self, annotation):
+
+        super().append(annotation)
+        self.watch([annotation])
+
+
+
+    def insert(self, position : int, annotation):
+
+        super().insert(position, annotation)
+        self.watch([annotation])
+
+
+
+    def extend(self, annotations):
+
+        annotations = list(annotations)
+        super().extend(annotations)
+        self.watch(annotations)
+
+
+
+    def __iadd__(self, annotations):
+
+        self.extend(annotations)
+        return self
+
+
+
+    def __setitem__(self, key, value):
+
+        super().__setitem__(key, value)
+        self.watch(value if isinstance(key, slice) else [value])
+
+
+
+    def __reduce__(self):
+
+        return (list, (list(self),))
+
+
+
+
+
+class Book(collections.abc.MutableMapping):
+    """Object for holding notes about arbitrary sequences of chess moves.
+    
+    If keyed by position, notes are held against the position a line reaches rather than the line itself, so they are shared by every move order reaching it."""
+
+    name : str
+    annotations : dict
+    changed : set
+    by_position : bool
+    position_lines : dict
+    line_index : list
+    index : Note_index
+
+
+    def __init__(self, name, by_position : bool = False):
+
+        self.name = name
+        self.annotations = dict()
+
+        #The note index watching the book, if any. Annotations added to a watched book are indexed as they are added.
+        self.index = None
+
+        #Keys changed since the book was last saved to a store. Books which are not stored do not track changes.
+        self.changed = None
+
+        #When keyed by position, annotations are held under Zobrist hashes, and the first line seen reaching each position is kept to stand for it.
+        self.by_position = by_position
+        self.position_lines = dict() if by_position else None
+
+        #Sorted (moves, annotation key) pairs for each annotated line, so the lines beginning with any given line lie next to each other.
+        self.line_index = []
+    
+
+
+    def __getstate__(self):
+
+        #The index is shared with other books, so it is not copied or pickled with each of them.
+        state = self.__dict__.copy()
+        state['index'] = None
+        return state
+
+
+
+    def own_line(self, line):
+        """Returns a copy of a line for the book to hold on to. Lines are often a navigator's address, which keeps changing after the book is used."""
+
+        return Chess_moves(line) if isinstance(line, Chess_moves) else line
+
+
+
+    def watched(self, value):
+        """Returns a list of annotations as an Annotation_list watched by the book's note index, if it has one. Other values are returned unchanged."""
+
+        if self.index is None or not isinstance(value, list):
+            return value
+
+        if not isinstance(value, Annotation_list):
+            value = Annotation_list(value)
+
+        value.index = self.index
+        value.watch(value)
+
+        return value
+
+
+
+    def annotation_key(self, line, zobrist : int = None):
+        """Returns the key the annotations of a line are held under: the line itself, or the Zobrist hash of the position it reaches if keyed by position.
+
+        If the hash of that position is already known it may be given, so the line is not replayed."""
+
+        if not self.by_position:
+            return line
+
+        import board
+        return board.zobrist_hashes(line)[-1] if zobrist is None else zobrist
+
+
+
+    def annotations_along(self, line) -> list:
+        """Returns (ply, annotation) pairs for each prefix of the line which is annotated, probing the book once per ply."""
+
+        if self.by_position:
+            import board
+            keys = board.zobrist_hashes(line)
+
+        else:
+            line = Chess_moves(*line) if not isinstance(line, Chess_moves) else line
+            keys = (line[:ply] for ply in range(len(line) + 1))
+
+        return [(ply, self.annotations[key]) for ply, key in enumerate(keys) if key in self.annotations]
+
+
+
+    def index_line(self, line, annotation_key):
+
+        entry = (tuple(line), annotation_key)
+        position = bisect.bisect_left(self.line_index, entry[:1])
+
+        if position == len(self.line_index) or self.line_index[position][0] != entry[0]:
+            self.line_index.insert(position, entry)
+
+
+
+    def unindex_line(self, line):
+
+        moves = tuple(line)
+        position = bisect.bisect_left(self.line_index, (moves,))
+
+        if position < len(self.line_index) and self.line_index[position][0] == moves:
+            del self.line_index[position]
+
+
+
+    def annotated_under(self, line) -> list:
+        """Returns (line, annotation) pairs for the given line and every annotated line continuing from it, sorted by their moves.
+
+        Takes time proportional to the number of lines returned. If keyed by position, the lines standing for each position are searched."""
+
+        prefix = tuple(line)
+        length = len(prefix)
+        position = bisect.bisect_left(self.line_index, (prefix,))
+        found = []
+
+        while position < len(self.line_index) and self.line_index[position][0][:length] == prefix:
+
+            moves, annotation_key = self.line_index[position]
+            found.append((Chess_moves.from_codes(array.array('H', [encode_move(move) for move in moves])), self.annotations[annotation_key]))
+            position += 1
+
+        return found
+
+
+
+    def get(self, key, default = None):
+        """Returns the annotation of a line, or the default if it has none. Unlike indexing, a miss leaves the book unchanged."""
+
+        try:
+            return self.annotations.get(self.annotation_key(key), default)
+
+        #Illegal lines reach no position, and lists of moves cannot be keys.
+        except (ValueError, TypeError):
+            return default
+
+
+
+    def __contains__(self, key):
+
+        sentinel = object()
+        return self.get(key, sentinel) is not sentinel
+
+
+
+    def __getitem__(self, key : Chess_moves):
+
+        try:
+
+            if any(not check_is_move_and_warn(move) for move in key):
+                return
+            
+            #The annotation returned may be modified by the caller, so it is counted as changed.
+            if self.changed is not None:
+                self.changed.add(self.own_line(key))
+
+            annotation_key = self.annotation_key(key)
+
+            if annotation_key in self.annotations.keys():
+                return self.annotations[annotation_key]
+            
+            else:
+                key = self.own_line(key)
+                annotation_key = annotation_key if self.by_position else key
+
+                if self.by_position:
+                    self.position_lines[annotation_key] = key
+
+                self.annotations[annotation_key] = self.watched([])
+                self.index_line(key, annotation_key)
+                return self.annotations[annotation_key]
+
+        except ValueError as error:
+            print(error)
+
+        except:
+            print("key not iterable sequence of moves.")
+
+
+
+    def __setitem__(self, key : Chess_moves, value):
+        
+        try:
+            if any(not check_is_move_and_warn(move) for move in key):
+                return
+
+            key = self.own_line(key)
+            annotation_key = self.annotation_key(key)
+
+            if self.by_position:
+                self.position_lines.setdefault(annotation_key, key)
+
+            if annotation_key not in self.annotations:
+                self.index_line(self.position_lines[annotation_key] if self.by_position else key, annotation_key)
+
+            self.annotations[annotation_key] = self.watched(value)
+
+            if self.changed is not None:
+                self.changed.add(key)
+
+        except ValueError as error:
+            print(error)
+
+        except:
+            print("key not iterable sequence of moves.")
+
+
+
+    def __delitem__(self, key : Chess_moves):
+
+        annotation_key = self.annotation_key(key)
+        value = self.annotations.pop(annotation_key)
+
+        #Deleted annotations are no longer found by searches.
+        if self.index is not None:
+            for annotation in (value if isinstance(value, list) else [value]):
+                if isinstance(annotation, Annotation):
+                    self.index.forget(annotation)
+
+        if self.by_position:
+            self.unindex_line(self.position_lines.pop(annotation_key))
+
+        else:
+            self.unindex_line(key)
+
+        if self.changed is not None:
+            self.changed.add(self.own_line(key))
+
+
+
+    def __iter__(self):
+
+        #A book keyed by position iterates over the lines standing for each position.
+        if self.by_position:
+            return iter(self.position_lines.values())
+        
+        return iter(self.annotations)
+    
+
+
+    def __len__(self):
+        
+        return len(self.annotations)
+
+
+
+
+
+class Chess_game(Chess_moves):
+    """Object for holding all data about a game.
+
+    Games are kept as the raw bytes of their PGN, and only decoded as needed. Each header is read from the bytes when asked for,
+    and the moves are tokenized the first time they are used, after which the movetext is dropped."""
+
+    __slots__ = ('raw', 'header_length', 'codes', 'date_number')
+
+    raw : bytes
+    header_length : int
+    codes : array.array
+    date_number : int
+
+
+
+    def __init__(self, game_data):
+        """Initializer intended to be initialized with chess data from Chess.com, as a string or as bytes."""
+
+        self.raw = game_data.encode('utf-8') if isinstance(game_data, str) else bytes(game_data)
+        self.header_length = header_block_end(self.raw)
+        self.codes = None
+        self.date_number = None
+        self.shared = False
+        self.prefix_hashes = None
+
+
+
+    @property
+    def move_codes(self) -> array.array:
+
+        if self.codes is None:
+            self.codes = array.array('H', [encode_move(move) for move in parse_pgn(self.raw[self.header_length:].decode('utf-8', 'replace'))[1]])
+            self.raw = self.raw[:self.header_length]
+
+        return self.codes
+
+
+
+    @move_codes.setter
+    def move_codes(self, move_codes : array.array):
+
+        self.codes = move_codes
+        self.raw = self.raw[:self.header_length]
+
+
+
+    def header(self, tag : str, default : str = None) -> str:
+        """Returns the value of a single header, decoding only that header."""
+
+        pattern = game_header_patterns.get(tag)
+
+        if pattern is None:
+            pattern = game_header_patterns[tag] = re.compile(rb'\[\s*' + re.escape(tag.encode('utf-8')) + rb'\s+"([^"]*)"\s*\]')
+
+        match = pattern.search(self.raw, 0, self.header_length)
+        return default if match is None else match.group(1).decode('utf-8', 'replace')
+
+
+
+    @property
+    def headers(self) -> dict:
+        """Every header of the game, decoded afresh on each use."""
+
+        return {tag.decode('utf-8', 'replace') : value.decode('utf-8', 'replace') for tag, value in compiled('header').findall(self.raw, 0, self.header_length)}
+
+
+
+    @property
+    def i_was_white(self) -> bool:
+
+        #My name will appear in the white player header if I was white.
+        return 'TheRealYzb25' in self.header('White', '')
+
+
+
+    @property
+    def opponent_elo(self) -> float:
+
+        #Find my opponent's ELO in the header of the colour I wasn't playing.
+        return float(self.header('BlackElo') if self.i_was_white else self.header('WhiteElo'))
+
+
+
+    @property
+    def did_i_win(self) -> bool:
+
+        #My name will appear in the termination phrase if I won.
+        return 'TheRealYzb25' in self.header('Termination', '')
+
+
+
+    @property
+    def ending_tag(self) -> str:
+
+        termination_phrase : str = self.header('Termination', '')
+
+        #Look for details about how the game ended in the termination phrase.
+        if 'drawn' in termination_phrase:
+            return 'draw'
+
+        elif 'time' in termination_phrase:
+            return 'time'
+
+        elif 'checkmate' in termination_phrase:
+            return 'checkmate'
+
+        else:
+            return 'resignation'
+
+
+
+    @property
+    def packed_date(self) -> int:
+        """The date the game was played as a single integer, e.g. 20230322. Unknown parts of the date are 0."""
+
+        if self.date_number is None:
+
+            parts = (self.header('Date', '????.??.??').split('.') + ['??', '??'])[:3]
+            year, month, day = (int(part) if part.isdigit() else 0 for part in parts)
+            self.date_number = year * 10000 + month * 100 + day
+
+        return self.date_number
+
+
+
+    @property
+    def date(self) -> dict:
+
+        #Derive date details from the packed date, writing unknown parts the way PGN does.
+        year, month, day = self.packed_date // 10000, self.packed_date // 100 % 100, self.packed_date % 100
+
+        return {'Year' : f'{year:04}' if year else '????', 'Month' : f'{month:02}' if month else '??', 'Day' : f'{day:02}' if day else '??'}
+
+
+
+    def __getstate__(self):
+
+        #Moves are pickled by name once tokenized, as interned codes are only meaningful within the current process. Until then the movetext is kept.
+        return {'raw' : self.raw, 'header_length' : self.header_length, 'list_of_moves' : None if self.codes is None else self.list_of_moves}
+
+
+
+    def __setstate__(self, state):
+
+        self.raw = state['raw']
+        self.header_length = state['header_length']
+        self.codes = None if state['list_of_moves'] is None else array.array('H', [encode_move(move) for move in state['list_of_moves']])
+        self.date_number = None
+        self.shared = False
+        self.prefix_hashes = None
+
+
+
+    def __str__(self):
+
+        my_colour = 'White' if self.i_was_white else 'Black'
+        win_state = 'victory' if self.did_i_win else 'defeat'
+        game_summary = 'was drawn' if self.ending_tag == 'drawn' else \
+            f'ended in {win_state} by {self.ending_tag}'
+        moves = super().__str__()
+
+        output : str =  f'''{self.date['Day']}/{self.date['Month']}/{self.date['Year']}
+Game as {my_colour} {game_summary}. Opponent ELO was {self.opponent_elo}
+Move details:
+{moves}'''
+
+        return output
+
+
+
+
+
+#Matches a PGN header line such as [Date "2023.03.22"], capturing the tag and its value.
+pattern_sources['header'] = (rb'\[\s*(\w+)\s+"([^"]*)"\s*\]', 0)
+
+#Patterns matching a single header of a game's raw bytes, compiled for each tag when it is first read.
+game_header_patterns : dict = dict()
+
+
+
+def parse_pgn_headers(header_lines : list) -> dict:
+    """Parses raw PGN header lines into a dictionary of tags and their values."""
+
+    headers = dict()
+
+    for line in header_lines:
+
+        match = compiled('header').match(line)
+
+        if match:
+            headers[match.group(1).decode('utf-8', 'replace')] = match.group(2).decode('utf-8', 'replace')
+
+    return headers
+
+
+
+def parse_pgn_date(date : str):
+    """Converts a PGN date such as '2023.03.22' into a date object. Returns None for unknown dates."""
+
+    try:
+        year, month, day = (int(part) for part in date.split('.'))
+        return datetime.date(year, month, day)
+
+    except ValueError:
+        return None
+
+
+
+def headers_match(headers : dict, start_date = None, end_date = None, eco : str = None, result : str = None) -> bool:
+    """Checks if a game's headers pass the given filters. Filters left as None are not applied."""
+
+    if eco is not None and not headers.get('ECO', '').startswith(eco):
+        return False
+
+    if result is not None and headers.get('Result') != result:
+        return False
+
+    if start_date is not None or end_date is not None:
+
+        date = parse_pgn_date(headers.get('Date', ''))
+
+        if date is None:
+            return False
+
+        if start_date is not None and date < start_date:
+            return False
+
+        if end_date is not None and date > end_date:
+            return False
+
+    return True
+
+
+
+def comment_left_open(line : bytes, in_comment : bool) -> bool:
+    """Returns whether a brace comment is still open at the end of a line of movetext, given whether one was open at its start.
+
+    Comments do not nest, so a brace comment ends at its first '}'. Outside a brace comment, ';' comments out the rest of the line, braces included."""
+
+    position = 0
+
+    while True:
+
+        if in_comment:
+
+            end = line.find(b'}', position)
+
+            if end < 0:
+                return True
+
+            in_comment, position = False, end + 1
+
+        else:
+
+            start, semicolon = line.find(b'{', position), line.find(b';', position)
+
+            if start < 0 or 0 <= semicolon < start:
+                return False
+
+            in_comment, position = True, start + 1
+
+
+
+def read_pgn_games(source, start_date = None, end_date = None, eco : str = None, result : str = None):
+    """Yields Chess_game objects one at a time from a PGN export, given as a file path or a binary stream.
+    
+    The export is read line by line, so only the game currently being read is held in memory. Games failing the header filters are skipped without their moves being parsed."""
+
+    stream = open(source, 'rb') if isinstance(source, (str, os.PathLike)) else source
+
+    try:
+
+        header_lines, move_lines = [], []
+        in_moves, wanted = False, True
+
+        #Whether a brace comment is left open by the lines read so far. A line inside a comment is never a header, even if it starts with '[' as in '[%clk 0:03:00]'.
+        in_comment = False
+
+        for line in stream:
+
+            line = line.strip()
+
+            if line.startswith(b'[') and not in_comment:
+
+                #A header line after some moves marks the start of the next game.
+                if in_moves:
+
+                    if wanted:
+                        yield Chess_game(b'\n'.join(header_lines + [b''] + move_lines))
+
+                    header_lines, move_lines = [], []
+                    in_moves = False
+
+                header_lines.append(line)
+
+            elif line:
+
+                #The filters are decided once all headers have been read, at the first line of moves.
+                if not in_moves:
+                    in_moves = True
+                    wanted = headers_match(parse_pgn_headers(header_lines), start_date, end_date, eco, result)
+
+                if wanted:
+                    move_lines.append(line)
+
+                in_comment = comment_left_open(line, in_comment)
+
+        if in_moves and wanted:
+            yield Chess_game(b'\n'.join(header_lines + [b''] + move_lines))
+
+    finally:
+
+        if stream is not source:
+            stream.close()
+
+
+
+
+
+class Line_node:
+    """Object for holding a single move of a line space, along with every continuation branching from it."""
+
+    #Spaces can hold millions of nodes, so they are kept without an attribute dictionary. A position is only set in spaces keyed by position.
+    __slots__ = ('children', 'size', 'position', 'digest')
+
+    children : dict
+    size : int
+    position : int
+    digest : int
+
+
+    def __init__(self):
+
+        self.children = dict()
+
+        #Size counts this node and every node beneath it, i.e. the number of lines in the subtree.
+        self.size = 1
+
+        #A hash of the subtree's shape, computed on demand and cleared whenever anything beneath the node changes.
+        self.digest = None
+
+
+
+    def get_digest(self) -> int:
+        """Returns a hash of the subtree beneath the node. Subtrees holding the same lines have the same digest."""
+
+        if self.digest is None:
+            self.digest = hash((self.size, frozenset([(move, child.get_digest()) for move, child in self.children.items()])))
+
+        return self.digest
+
+
+
+    def same_lines(self, other) -> bool:
+        """Checks the subtree beneath the node holds exactly the same lines as the subtree beneath another.
+
+        Digests rule out most differing subtrees at once, but a match is confirmed node by node, so a collision of digests cannot give a wrong answer."""
+
+        if self is other:
+            return True
+
+        if self.size != other.size or self.get_digest() != other.get_digest():
+            return False
+
+        stack = [(self, other)]
+
+        while stack:
+
+            node, other_node = stack.pop()
+
+            if node.size != other_node.size or node.children.keys() != other_node.children.keys():
+                return False
+
+            stack.extend((child, other_node.children[move]) for move, child in node.children.items())
+
+        return True
+
+
+
+    def copy(self, node_class):
+        """Returns a copy of the subtree beneath the node, made of nodes of the given class."""
+
+        node = node_class()
+        node.copy_data(self)
+        node.children = {move : child.copy(node_class) for move, child in self.children.items()}
+
+        return node
+
+
+
+    def copy_data(self, other):
+        """Copies everything held on another node other than its children. Subclasses holding extra data about each line copy it here too."""
+
+        self.size, self.digest = other.size, other.digest
+
+
+
+    def walk(self, prefix : list):
+        """Yields the moves of every line in the subtree, starting with the line ending at this node."""
+
+        yield prefix
+
+        for move, child in self.children.items():
+            yield from child.walk(prefix + [move])
+
+
+
+
+
+class Line_space(collections.abc.MutableSet):
+    """Object for holding data about preferred chess lines."""
+
+
+    name : str
+    is_white : bool
+    root : Line_node
+    u_num : int
+    changes : list
+    positions : dict
+
+    #The type of node the lines are stored in. Subclasses may store extra data about each line in their own type of node.
+    node_class = Line_node
+
+
+    def __init__(self, name, is_white, lines, by_position : bool = False):
+
+        self.name = name
+        self.is_white = is_white
+        self.u_num = 0
+
+        #Lines added and discarded since the space was last saved to a store. Spaces which are not stored do not track changes.
+        self.changes = None
+
+        #When keyed by position, each node also records the Zobrist hash of its position, and the nodes reaching each position are indexed by it.
+        #Membership and continuations are then shared between move orders which transpose into each other.
+        self.positions = dict() if by_position else None
+
+        #Lines are stored as a tree of moves, so sub-lines sharing a prefix share the same nodes. An empty space has no root.
+        self.root = None
+        self.build(lines)
+
+
+
+    @classmethod
+    def from_games(cls, name, is_white, games, max_ply : int = None, min_count : int = 1, **arguments):
+        """Builds a space of this class from the games I played as the given colour, keeping only lines reached by at least min_count of them.
+
+        Any further arguments are passed to the constructor, such as the uniqueness number of a Unique_line_space."""
+
+        space = cls(name, is_white, [], **arguments)
+        space.build((game for game in games if game.i_was_white == is_white), max_ply, min_count)
+        return space
+
+
+
+    def build(self, lines, max_ply : int = None, min_count : int = 1):
+        """Replaces the contents of the space with the given lines in a single pass over them.
+        
+        Lines are cut off after max_ply moves, and sublines reached by fewer than min_count of the lines are left out."""
+
+        self.root = None
+
+        #Without a frequency threshold, lines are inserted as they stream past, sharing nodes with every earlier line with the same prefix.
+        if min_count <= 1:
+
+            for line in lines:
+
+                if self.root is None:
+                    self.root = self.node_class()
+
+                self.insert(itertools.islice(line, max_ply))
+
+        else:
+            self.root = self.build_frequent(lines, max_ply, min_count)
+
+        if self.positions is not None:
+            self.index_positions()
+
+        #A rebuilt space is saved to a store whole, rather than as a list of changes.
+        self.changes = None
+
+
+
+    def build_frequent(self, lines, max_ply : int, min_count : int) -> Line_node:
+        """Returns the root of a tree of the sublines reached by at least min_count of the given lines, or None if there are none."""
+
+        return self.prune_rare(self.count_lines(lines, max_ply), lambda node : node.size, min_count)
+
+
+
+    def count_lines(self, lines, max_ply : int) -> Line_node:
+        """Returns the root of a tree of the given lines, cut off after max_ply moves, where each node's size holds the number of lines passing through it."""
+
+        root = self.node_class()
+        root.size = 0
+
+        for line in lines:
+
+            node = root
+            node.size += 1
+
+            for move in itertools.islice(line, max_ply):
+
+                child = node.children.get(move)
+
+                if child is None:
+                    child = node.children[move] = self.node_class()
+                    child.size = 0
+
+                child.size += 1
+                node = child
+
+        return root
+
+
+
+    def prune_rare(self, root : Line_node, count, min_count : int) -> Line_node:
+        """Cuts away every node the count function gives less than min_count, along with everything beneath it, then recounts the sizes of the nodes left.
+
+        Returns the root, or None if the root is itself rare."""
+
+        if count(root) < min_count:
+            return None
+
+        #Rare sublines are cut away on the way down, then sizes are recounted on the way back up.
+        order = [root]
+
+        for node in order:
+
+            for move in [move for move, child in node.children.items() if count(child) < min_count]:
+                del node.children[move]
+
+            order.extend(node.children.values())
+
+        for node in reversed(order):
+            node.size = 1 + sum([child.size for child in node.children.values()])
+            node.digest = None
+
+        return root
+
+
+
+    def index_positions(self):
+        """Rebuilds the position index by replaying the whole tree once, playing a single move per node."""
+
+        self.positions.clear()
+
+        if self.root is None:
+            return
+
+        import board
+        position = board.Chess_position()
+
+        def visit(node):
+
+            self.index_position(node, position.zobrist)
+
+            for move, child in node.children.items():
+                position.push_san(move)
+                visit(child)
+                position.unmake_move()
+
+        visit(self.root)
+
+
+
+    @property
+    def lines(self):
+        """Materialises the set of every line in the space. Prefer the tree-based methods where possible."""
+
+        return set(self)
+
+
+
+    def is_your_move(self, move_number : int):
+        """Verifies if it is our move based on move number our colour."""
+        
+        #If move_number is even, it is black's turn.
+        return (move_number % 2) != self.is_white
+    
+
+
+    def find_node(self, line):
+        """Returns the node at the end of the given line, or None if the line is not in the space."""
+
+        node = self.root
+
+        for move in line:
+
+            if node is None:
+                return None
+
+            node = node.children.get(move)
+
+        return node
+    
+
+
+    def deviation(self, line):
+        """Returns (ply, move) for the first move of a line which leaves the space, or None if the whole line is in it.
+
+        A line only leaves the space where the space had moves to play and the move played is not among them. A line which runs past the end of the space has kept to it.
+        The ply counts the moves played before leaving, so is_your_move(ply) tells whether I or my opponent left.
+        Walks the tree once along the line. A space keyed by position follows transpositions instead, leaving at the first position it does not hold."""
+
+        moves = line.list_of_moves if isinstance(line, Chess_moves) else list(line)
+
+        if self.root is None:
+            return None
+
+        if self.positions is not None:
+
+            import board
+            hashes = board.zobrist_hashes(moves)
+
+            for ply, position in enumerate(hashes[1:]):
+
+                if position not in self.positions:
+
+                    #Any node reaching the position before the move may have continuations, as lines transpose into it.
+                    if any(node.children for node in self.positions[hashes[ply]]):
+                        return ply, moves[ply]
+
+                    return None
+
+            return None
+
+        node = self.root
+
+        for ply, move in enumerate(moves):
+
+            if not node.children:
+                return None
+
+            node = node.children.get(move)
+
+            if node is None:
+                return ply, move
+
+        return None
+
+
+
+    def deviations(self, games, processes : int = 1, chunk_size : int = 500):
+        """Yields (game, ply, move, by_me) for each game, giving where it first left the space as from deviation. Games which never left, including those which ran past its end, give None for all three.
+
+        Games are read in chunks, so archives of any size stream through. With more than one process, chunks are shared out between worker processes."""
+
+        games = iter(games)
+        chunks = iter(lambda : list(itertools.islice(games, chunk_size)), [])
+
+        if processes <= 1:
+
+            for chunk in chunks:
+                yield from self.label_deviations(chunk, [self.deviation(game) for game in chunk])
+
+            return
+
+        import multiprocessing
+        pool = multiprocessing.Pool(processes, initializer = set_deviation_space, initargs = (self,))
+        pending = collections.deque()
+
+        try:
+            for chunk in chunks:
+
+                #Only the moves of each game are sent to the workers, by name, as interned codes differ between processes.
+                pending.append((chunk, pool.apply_async(find_deviations, ([game.list_of_moves for game in chunk],))))
+
+                #A few chunks are kept in flight per worker, so memory stays bounded however large the archive.
+                if len(pending) > 2 * processes:
+                    chunk, result = pending.popleft()
+                    yield from self.label_deviations(chunk, result.get())
+
+            while pending:
+                chunk, result = pending.popleft()
+                yield from self.label_deviations(chunk, result.get())
+
+        finally:
+            pool.terminate()
+
+
+
+    def label_deviations(self, games : list, found : list):
+
+        for game, deviation in zip(games, found):
+
+            if deviation is None:
+                yield game, None, None, None
+
+            else:
+                yield game, deviation[0], deviation[1], self.is_your_move(deviation[0])
+
+
+
+    def deviation_summary(self, games, processes : int = 1, chunk_size : int = 500) -> dict:
+        """Counts where games I played as the colour of the space left it.
+
+        Returns the number of games which stayed in the space, left it by my move or left it by my opponent's, and a Counter of each deviation point:
+        the moves leading up to it, the move which left and whether it was mine."""
+
+        summary = {'in_repertoire' : 0, 'by_me' : 0, 'by_opponent' : 0, 'points' : collections.Counter()}
+        games = (game for game in games if getattr(game, 'i_was_white', self.is_white) == self.is_white)
+
+        for game, ply, move, by_me in self.deviations(games, processes, chunk_size):
+
+            if ply is None:
+                summary['in_repertoire'] += 1
+                continue
+
+            summary['by_me' if by_me else 'by_opponent'] += 1
+            summary['points'][(tuple(game.list_of_moves[:ply]), move, by_me)] += 1
+
+        return summary
+
+
+
+    def end_lines(self):
+        """Yields the moves of each line which is not a subline of another. Together with their sublines, these make up the whole space."""
+
+        if self.root is None:
+            return
+
+        stack = [((), self.root)]
+
+        while stack:
+
+            moves, node = stack.pop()
+
+            if not node.children:
+                yield moves
+
+            stack.extend((moves + (move,), child) for move, child in node.children.items())
+    
+
+
+    def filter_for_length(self, length : int):
+
+        if self.root is None:
+            return set()
+
+        #Only descend as far as the requested length, rather than visiting the whole tree.
+        frontier = [([], self.root)]
+
+        for _ in range(length):
+            frontier = [(prefix + [move], child) for prefix, node in frontier for move, child in node.children.items()]
+
+        return {Chess_moves(*line) for line, _ in frontier}
+    
+
+
+    def position_of(self, line):
+        """Returns the Zobrist hash of the position a line reaches, or None if the line is illegal."""
+
+        import board
+
+        try:
+            return board.zobrist_hashes(line)[-1]
+
+        except ValueError:
+            return None
+
+
+
+    def get_continuations(self, line, zobrist : int = None):
+        """Returns each line continuing the given line by one move. A space keyed by position may be given the hash of the position the line reaches, so it is not replayed."""
+
+        moves = list(line)
+
+        #A space keyed by position continues from every node reaching the same position, by whatever move order.
+        if self.positions is not None:
+            nodes = self.positions.get(self.position_of(moves) if zobrist is None else zobrist, [])
+            return {Chess_moves(*moves, move) for node in nodes for move in node.children}
+
+        node = self.find_node(moves)
+
+        if node is None:
+            return set()
+
+        return {Chess_moves(*moves, move) for move in node.children}
+    
+
+
+    def __contains__(self, line):
+        """Extends standard set behaviour to Line_space."""
+
+        if self.positions is not None:
+            return self.position_of(line) in self.positions
+
+        return self.find_node(line) is not None
+    
+
+
+    def __iter__(self):
+        """Extends standard set behaviour to Line_space."""
+
+        if self.root is None:
+            return iter(())
+
+        return (Chess_moves(*line) for line in self.root.walk([]))
+    
+
+
+    def __len__(self):
+        """Extends standard set behaviour to Line_space."""
+        
+        return 0 if self.root is None else self.root.size
+    
+
+
+    def add(self, line):
+        """Extends standard set behaviour to Line_space."""
+
+        #Lines are replayed before anything is changed, so an illegal line leaves the space untouched.
+        hashes = None
+
+        if self.positions is not None:
+            import board
+            hashes = board.zobrist_hashes(line)
+
+        if self.changes is not None:
+            self.changes.append(('add', tuple(line)))
+
+        if self.root is None:
+            self.root = self.node_class()
+
+            if hashes is not None:
+                self.index_position(self.root, hashes[0])
+
+        path, first_new = self.insert(line)
+
+        if hashes is not None:
+            for depth in range(first_new, len(path)):
+                self.index_position(path[depth], hashes[depth])
+
+
+
+    def insert(self, moves):
+        """Walks down the tree along the moves from the root, which must exist, creating nodes as needed so all sublines are also added.
+        
+        Returns the path of nodes walked and the index of the first node created along it."""
+
+        path = [self.root]
+        first_new = None
+
+        for move in moves:
+
+            child = path[-1].children.get(move)
+
+            if child is None:
+                first_new = len(path) if first_new is None else first_new
+                child = path[-1].children[move] = self.node_class()
+
+            path.append(child)
+
+        if first_new is None:
+            return path, len(path)
+
+        #Existing nodes gain every new node beneath them, and each new node holds the new nodes below it.
+        added = len(path) - first_new
+
+        for node in path[:first_new]:
+            node.size += added
+            node.digest = None
+
+        for depth in range(first_new, len(path)):
+            path[depth].size = len(path) - depth
+
+        return path, first_new
+
+
+
+    def index_position(self, node : Line_node, position : int):
+
+        node.position = position
+        self.positions.setdefault(position, []).append(node)
+
+
+
+    def discard(self, line_to_discard):
+        """Extends standard set behaviour to Line_space."""
+
+        moves = list(line_to_discard)
+
+        if self.changes is not None:
+            self.changes.append(('discard', tuple(moves)))
+
+        #Discarding the empty line discards every line in the space.
+        if not moves:
+            self.root = None
+
+            if self.positions is not None:
+                self.positions.clear()
+
+            return
+
+        #Find the parent of the discarded line, so the whole subtree beneath it can be detached at once.
+        path = [self.root]
+
+        for move in moves[:-1]:
+
+            if path[-1] is None:
+                return
+
+            path.append(path[-1].children.get(move))
+
+        if path[-1] is None or moves[-1] not in path[-1].children:
+            return
+
+        removed = path[-1].children.pop(moves[-1])
+
+        for node in path:
+            node.size -= removed.size
+            node.digest = None
+
+        #Every node in the discarded subtree is taken out of the position index.
+        if self.positions is not None:
+
+            stack = [removed]
+
+            while stack:
+
+                node = stack.pop()
+                stack.extend(node.children.values())
+                self.positions[node.position].remove(node)
+
+                if not self.positions[node.position]:
+                    del self.positions[node.position]
+
+
+
+    def copy(self):
+        """Returns a copy of the space, sharing no nodes with it."""
+
+        space = self.__class__.__new__(self.__class__)
+        space.__dict__.update(self.__dict__)
+        space.root = None if self.root is None else self.root.copy(self.node_class)
+        space.changes = None
+
+        if self.positions is not None:
+            space.positions = dict()
+            space.index_positions()
+
+        return space
+
+
+
+    def restructured(self):
+        """Brings the position index and change tracking up to date after the tree has been edited directly by a set operation."""
+
+        if self.positions is not None:
+            self.index_positions()
+
+        #Structural edits are not recorded line by line, so a stored space is next saved whole.
+        self.changes = None
+
+
+
+    def _from_iterable(self, lines):
+        """Lets the generic set operators build a plain space from the lines they produce, such as when combining a space with a set.
+
+        The new space keeps the name and colour of this one, and is keyed by position if this one is."""
+
+        return Line_space(self.name, self.is_white, lines, self.positions is not None)
+
+
+
+    def union_update(self, other : 'Line_space'):
+        """Adds every line of the other space, walking both trees together and skipping subtrees they already share."""
+
+        if other.root is None:
+            return self
+
+        if self.root is None:
+            self.root = other.root.copy(self.node_class)
+            self.restructured()
+            return self
+
+        node_class = self.node_class
+
+        def merge(node, other_node):
+
+            if node.same_lines(other_node):
+                return
+
+            for move, other_child in other_node.children.items():
+
+                child = node.children.get(move)
+
+                if child is None:
+                    node.children[move] = other_child.copy(node_class)
+
+                else:
+                    merge(child, other_child)
+
+            node.size = 1 + sum([child.size for child in node.children.values()])
+            node.digest = None
+
+        merge(self.root, other.root)
+        self.restructured()
+
+        return self
+
+
+
+    def intersection_update(self, other : 'Line_space'):
+        """Keeps only the lines also in the other space, walking both trees together and skipping subtrees they already share."""
+
+        if self.root is None:
+            return self
+
+        def intersect(node, other_node):
+
+            if node.same_lines(other_node):
+                return
+
+            for move in list(node.children):
+
+                other_child = other_node.children.get(move)
+
+                if other_child is None:
+                    del node.children[move]
+
+                else:
+                    intersect(node.children[move], other_child)
+
+            node.size = 1 + sum([child.size for child in node.children.values()])
+            node.digest = None
+
+        if other.root is None:
+            self.root = None
+
+        else:
+            intersect(self.root, other.root)
+
+        self.restructured()
+
+        return self
+
+
+
+    def difference_update(self, other : 'Line_space'):
+        """Removes the lines of the other space, keeping any line which still leads on to a line of this space the other lacks.
+
+        Spaces hold every subline of their lines, so the shared sublines of the remaining lines stay in the space."""
+
+        if self.root is None or other.root is None:
+            return self
+
+        #Returns whether anything beneath the node is missing from the other space, pruning everything else.
+        def prune(node, other_node):
+
+            if other_node is None:
+                return True
+
+            if node.same_lines(other_node):
+                return False
+
+            for move in list(node.children):
+                if not prune(node.children[move], other_node.children.get(move)):
+                    del node.children[move]
+
+            if not node.children:
+                return False
+
+            node.size = 1 + sum([child.size for child in node.children.values()])
+            node.digest = None
+
+            return True
+
+        if not prune(self.root, other.root):
+            self.root = None
+
+        self.restructured()
+
+        return self
+
+
+
+    def issubset(self, other : 'Line_space') -> bool:
+        """Checks every line of the space is in the other, walking both trees together and skipping subtrees they share."""
+
+        def contained(node, other_node):
+
+            if other_node is None or node.size > other_node.size:
+                return False
+
+            if node.same_lines(other_node):
+                return True
+
+            return all(contained(child, other_node.children.get(move)) for move, child in node.children.items())
+
+        if self.root is None:
+            return True
+
+        return other.root is not None and contained(self.root, other.root)
+
+
+
+    def issuperset(self, other : 'Line_space') -> bool:
+
+        return other.issubset(self)
+
+
+
+    def union(self, other : 'Line_space'):
+
+        return self.copy().union_update(other)
+
+
+
+    def intersection(self, other : 'Line_space'):
+
+        return self.copy().intersection_update(other)
+
+
+
+    def difference(self, other : 'Line_space'):
+
+        return self.copy().difference_update(other)
+
+
+
+    def symmetric_difference(self, other : 'Line_space'):
+
+        return self.difference(other).union_update(other.difference(self))
+
+
+
+    #The generic set operators would rebuild spaces line by line through the constructor, so the structural operations are used between spaces.
+    #Against plain sets and other iterables, the generic operators are used as before.
+    def __or__(self, other):
+
+        return self.union(other) if isinstance(other, Line_space) else collections.abc.Set.__or__(self, other)
+
+
+
+    def __and__(self, other):
+
+        return self.intersection(other) if isinstance(other, Line_space) else collections.abc.Set.__and__(self, other)
+
+
+
+    def __sub__(self, other):
+
+        return self.difference(other) if isinstance(other, Line_space) else collections.abc.Set.__sub__(self, other)
+
+
+
+    def __xor__(self, other):
+
+        return self.symmetric_difference(other) if isinstance(other, Line_space) else collections.abc.Set.__xor__(self, other)
+
+
+
+    def __ior__(self, other):
+
+        return self.union_update(other) if isinstance(other, Line_space) else collections.abc.MutableSet.__ior__(self, other)
+
+
+
+    def __iand__(self, other):
+
+        return self.intersection_update(other) if isinstance(other, Line_space) else collections.abc.MutableSet.__iand__(self, other)
+
+
+
+    def __isub__(self, other):
+
+        return self.difference_update(other) if isinstance(other, Line_space) else collections.abc.MutableSet.__isub__(self, other)
+
+
+
+    def __ixor__(self, other):
+
+        if not isinstance(other, Line_space):
+            return collections.abc.MutableSet.__ixor__(self, other)
+
+        result = self.symmetric_difference(other)
+        self.root = result.root
+        self.restructured()
+
+        return self
+
+
+
+    def __le__(self, other):
+
+        return self.issubset(other) if isinstance(other, Line_space) else collections.abc.Set.__le__(self, other)
+
+
+
+    def __ge__(self, other):
+
+        return other.issubset(self) if isinstance(other, Line_space) else collections.abc.Set.__ge__(self, other)
+
+
+
+    def __lt__(self, other):
+
+        if not isinstance(other, Line_space):
+            return collections.abc.Set.__lt__(self, other)
+
+        return len(self) < len(other) and self.issubset(other)
+
+
+
+    def __gt__(self, other):
+
+        if not isinstance(other, Line_space):
+            return collections.abc.Set.__gt__(self, other)
+
+        return len(self) > len(other) and other.issubset(self)
+
+
+
+    def __eq__(self, other):
+
+        if not isinstance(other, Line_space):
+            return collections.abc.Set.__eq__(self, other)
+
+        return len(self) == len(other) and self.issubset(other)
+
+
+    
+
+
+#The line space worker processes compare games against, set once as each worker starts.
+deviation_space : Line_space = None
+
+
+
+def set_deviation_space(space : Line_space):
+
+    global deviation_space
+    deviation_space = space
+
+
+
+def find_deviations(move_lists : list) -> list:
+    """Finds where each of a chunk of games left the worker's line space."""
+
+    return [deviation_space.deviation(moves) for moves in move_lists]
+
+
+
+
+
+class Unique_line_space(Line_space):
+    """Object for holding data about preferred chess line, but a single unique response to each opponent move is necessitated, for moves greater than a certain "uniqueness_number".
+    
+    As the lines are held in a tree, each response is a child of the node for the opponent's move, so uniqueness only needs checking along the path of a line."""
+
+
+    def __init__(self, name, is_white, lines, uniqueness_number, by_position : bool = False):
+        
+        super().__init__(name, is_white, [], by_position)
+        self.u_num = uniqueness_number
+        self.build(lines)
+
+
+
+    def build(self, lines, max_ply : int = None, min_count : int = 1):
+        """Replaces the contents of the space with the given lines, cut off after max_ply moves and leaving out sublines reached by fewer than min_count of them.
+
+        Lines are added in order, so a later line replaces any earlier line it contradicts. With a frequency threshold, the more frequent of two contradicting lines is kept."""
+
+        #The frequent lines are counted first, as uniqueness cannot be kept while counting, then added least frequent first.
+        if min_count > 1:
+            lines, max_ply = [moves for _, moves in sorted(self.frequent_end_lines(lines, max_ply, min_count))], None
+
+        self.root = None
+        self.changes = None
+
+        if self.positions is not None:
+            self.positions.clear()
+
+        for line in lines:
+            self.add(list(itertools.islice(line, max_ply)))
+
+
+
+    def frequent_end_lines(self, lines, max_ply : int, min_count : int) -> list:
+        """Returns (count, moves) pairs for each line reached by at least min_count of the given lines which no longer such line continues."""
+
+        root = self.count_lines(lines, max_ply)
+
+        if root.size < min_count:
+            return []
+
+        found = []
+        stack = [((), root)]
+
+        while stack:
+
+            moves, node = stack.pop()
+            frequent = [(moves + (move,), child) for move, child in node.children.items() if child.size >= min_count]
+
+            if not frequent:
+                found.append((node.size, moves))
+
+            stack.extend(frequent)
+
+        return found
+
+
+
+    def union_update(self, other : Line_space):
+        """Adds every line of the other space. Lines of the other space replace any lines of this space they contradict."""
+
+        #Removing lines cannot break uniqueness, so only adding needs to go line by line.
+        for line in other.end_lines():
+            self.add(line)
+
+        return self
+
+
+
+    def needs_uniqueness(self, move_number : int) -> bool:
+        """Checks if only a single move may follow the given number of moves, i.e. it is our move and the uniqueness number has been reached."""
+
+        return self.is_your_move(move_number) and divmod(move_number, 2)[0] + 1 >= self.u_num
+
+
+
+    def find_contradicting_lines(self, line) -> list:
+        """Returns every line in the space which gives a different response to one of the opponent moves in the given line."""
+
+        moves = list(line)
+        contradicting_lines = []
+        node = self.root
+
+        for move_num, move in enumerate(moves):
+
+            if node is None:
+                break
+
+            if self.needs_uniqueness(move_num):
+                contradicting_lines.extend(Chess_moves(*moves[:move_num], other) for other in node.children if other != move)
+
+            node = node.children.get(move)
+
+        return contradicting_lines
+
+
+
+    def find_contradicting_line(self, line):
+
+        contradicting_lines = self.find_contradicting_lines(line)
+        return contradicting_lines[0] if contradicting_lines else None
+
+
+
+    def check_uniqueness(self, line) -> bool:
+        """Checks that each of our moves along the line is the only response the space gives where one is required."""
+
+        node = self.root
+
+        for move_num, move in enumerate([*line, None]):
+
+            if node is None:
+                return True
+
+            if self.needs_uniqueness(move_num) and len(node.children) > 1:
+                return False
+
+            node = node.children.get(move) if move is not None else None
+
+        return True
+
+
+
+    def add(self, line):
+        """Adds a line, discarding any lines it contradicts. Returns the discarded lines."""
+
+        contradicting_lines = self.find_contradicting_lines(line)
+
+        for contradicting_line in contradicting_lines:
+            super().discard(contradicting_line)
+
+        super().add(line)
+        return contradicting_lines
+    
+
+
+
+
+class Explorer_node(Line_node):
+    """Object for holding a single move of an opening explorer, along with the results of the games which reached it."""
+
+    #Explorers hold a node per move of every game, so like plain nodes they are kept without an attribute dictionary.
+    __slots__ = ('games', 'wins', 'draws', 'losses')
+
+    games : int
+    wins : int
+    draws : int
+    losses : int
+
+
+    def __init__(self):
+
+        super().__init__()
+        self.games, self.wins, self.draws, self.losses = 0, 0, 0, 0
+
+
+
+    def copy_data(self, other):
+
+        super().copy_data(other)
+
+        #A node copied from a plain line space has no games counted on it.
+        if isinstance(other, Explorer_node):
+            self.games, self.wins, self.draws, self.losses = other.games, other.wins, other.draws, other.losses
+
+
+
+    def record(self, did_i_win : bool, was_drawn : bool):
+        """Counts the result of a game which reached this move."""
+
+        self.games += 1
+
+        if did_i_win:
+            self.wins += 1
+
+        elif was_drawn:
+            self.draws += 1
+
+        else:
+            self.losses += 1
+
+
+
+    def __str__(self):
+
+        return f'{self.games} games: {self.wins} won, {self.draws} drawn, {self.losses} lost.'
+
+
+
+
+
+class Opening_explorer(Line_space):
+    """Object for holding every line played in a collection of my games as one colour, along with how often each continuation was played and my results with it.
+    
+    Results are counted on each move as games are added, so queries never need to look at the games themselves."""
+
+    node_class = Explorer_node
+    max_depth : int
+
+
+    def __init__(self, name, is_white, games = (), max_depth : int = None):
+
+        self.max_depth = max_depth
+        super().__init__(name, is_white, games)
+
+
+
+    def build(self, games, max_ply : int = None, min_count : int = 1):
+        """Replaces the contents of the explorer with the given games, counting their results. Games I played as the other colour are skipped.
+
+        Games are cut off after max_ply moves, or the explorer's max depth if none is given, and moves played in fewer than min_count games are left out."""
+
+        self.root = None
+        self.changes = None
+
+        if self.positions is not None:
+            self.positions.clear()
+
+        for game in games:
+            self.add_game(game, max_ply)
+
+        if min_count <= 1 or self.root is None:
+            return
+
+        self.root = self.prune_rare(self.root, lambda node : node.games, min_count)
+
+        if self.positions is not None:
+            self.index_positions()
+
+
+
+    def add_game(self, game, max_ply : int = None) -> bool:
+        """Adds the moves of a game and counts its result on each of them. Games I played as the other colour are skipped."""
+
+        if game.i_was_white != self.is_white:
+            return False
+
+        line = game[:self.max_depth if max_ply is None else max_ply]
+        self.add(line)
+
+        was_drawn = game.ending_tag == 'draw'
+        node = self.root
+        node.record(game.did_i_win, was_drawn)
+
+        for move in line:
+            node = node.children[move]
+            node.record(game.did_i_win, was_drawn)
+
+        return True
+
+
+
+    def statistics(self, line) -> Explorer_node:
+        """Returns the results of the games which reached the given line, or None if no game did."""
+
+        return self.find_node(line)
+
+
+
+    def explore(self, line) -> list:
+        """Returns each continuation played from the given line alongside its results, most played first."""
+
+        node = self.find_node(line)
+
+        if node is None:
+            return []
+
+        return sorted(node.children.items(), key = lambda continuation : continuation[1].games, reverse = True)
+
+
+
+
+
+class Stored_collection(collections.abc.MutableMapping):
+    """Object for holding a named collection of books, games or line spaces in a Record_store. Each object is only read from the store when first accessed."""
+
+    store : storage.Record_store
+    name : str
+    head : tuple
+    offsets : dict
+    headers : dict
+    loaded : dict
+    replaced : set
+
+
+    def __init__(self, store : storage.Record_store, name : str, head : tuple):
+
+        self.store = store
+        self.name = name
+        self.head = head
+
+        #Offsets of each object's record are read from the store on first use of the collection.
+        self.offsets = None
+        self.headers = dict()
+        self.loaded = dict()
+        self.replaced = set()
+
+
+
+    def load_offsets(self) -> dict:
+
+        if self.offsets is None:
+
+            self.offsets = dict()
+
+            for name, offset in self.store.read_changes(self.head):
+
+                if offset is None:
+                    self.offsets.pop(name, None)
+                else:
+                    self.offsets[name] = offset
+
+        return self.offsets
+
+
+
+    def load_object(self, header : dict):
+        """Rebuilds an object from its record, replaying its chain of changes."""
+
+        if header['kind'] == 'book':
+
+            book = Book(header['name'], header.get('by_position', False))
+
+            for action, moves, value in self.store.read_changes(header['annotations']):
+
+                if action == 'set':
+                    book[Chess_moves(*moves)] = value
+
+                elif book.annotation_key(moves) in book.annotations:
+                    del book[Chess_moves(*moves)]
+
+            book.changed = set()
+            return book
+
+        if header['kind'] == 'line_space':
+
+            #The lines were checked when first added, so they are replayed without any further checks.
+            space_class = Unique_line_space if header['unique'] else Line_space
+            space = space_class.__new__(space_class)
+            Line_space.__init__(space, header['name'], header['is_white'], [], header.get('by_position', False))
+            space.u_num = header['u_num']
+
+            for action, moves in self.store.read_changes(header['lines']):
+
+                if action == 'add':
+                    Line_space.add(space, moves)
+                else:
+                    Line_space.discard(space, moves)
+
+            space.changes = []
+            return space
+
+        return header['value']
+
+
+
+    def save_object(self, name : str, value):
+        """Appends the changes to an object since it was last saved, returning its new header record, or None if it is unchanged."""
+
+        import storage
+
+        header = self.headers.get(name)
+        replaced = header is None or name in self.replaced
+
+        if isinstance(value, Book):
+
+            #A new book, or one with a long chain of changes, is saved whole.
+            if replaced or value.changed is None or header['annotations'][1] >= storage.max_chain_length:
+                changes = [('set', tuple(line), value.annotations[value.annotation_key(line)]) for line in value]
+                annotations = self.store.append_changes(None, changes, snapshot = True)
+
+            elif value.changed:
+                keys = {key : value.annotation_key(key) for key in value.changed}
+                changes = [('set', tuple(key), value.annotations[keys[key]]) if keys[key] in value.annotations else ('delete', tuple(key), None) for key in keys]
+                annotations = self.store.append_changes(header['annotations'], changes)
+
+            else:
+                annotations = header['annotations']
+
+            value.changed = set()
+            new_header = {'kind' : 'book', 'name' : value.name, 'by_position' : value.by_position, 'annotations' : annotations}
+
+        elif isinstance(value, Line_space):
+
+            if replaced or value.changes is None or header['lines'][1] >= storage.max_chain_length:
+                changes = [('add', moves) for moves in value.end_lines()]
+                lines = self.store.append_changes(None, changes, snapshot = True)
+
+            elif value.changes:
+                lines = self.store.append_changes(header['lines'], value.changes)
+
+            else:
+                lines = header['lines']
+
+            value.changes = []
+            new_header = {'kind' : 'line_space', 'name' : value.name, 'is_white' : value.is_white, 'u_num' : value.u_num,
+                          'unique' : isinstance(value, Unique_line_space), 'by_position' : value.positions is not None, 'lines' : lines}
+
+        else:
+
+            #Other objects, such as games, are only saved when they are set.
+            if not replaced:
+                return None
+
+            new_header = {'kind' : 'object', 'value' : value}
+
+        return None if new_header == header else new_header
+
+
+
+    def save(self) -> tuple:
+        """Appends every change to the collection since it was last saved, returning the new head of its chain of changes."""
+
+        import storage
+
+        offsets = self.load_offsets()
+        changes = []
+
+        for name in [name for name in offsets if name not in self.loaded and name in self.replaced]:
+            changes.append((name, None))
+            del offsets[name]
+
+        for name, value in self.loaded.items():
+
+            header = self.save_object(name, value)
+
+            if header is not None:
+                offsets[name] = self.store.append(header)
+                self.headers[name] = header if header['kind'] != 'object' else {'kind' : 'object'}
+                changes.append((name, offsets[name]))
+
+        self.replaced = set()
+
+        if self.head is not None and self.head[1] >= storage.max_chain_length:
+            self.head = self.store.append_changes(None, list(offsets.items()), snapshot = True)
+
+        elif changes:
+            self.head = self.store.append_changes(self.head, changes)
+
+        return self.head
+
+
+
+    def __getitem__(self, name):
+
+        if name not in self.loaded:
+
+            offset = self.load_offsets()[name]
+            header = self.store.read(offset)
+
+            self.loaded[name] = self.load_object(header)
+            self.headers[name] = header if header['kind'] != 'object' else {'kind' : 'object'}
+
+        return self.loaded[name]
 
 
-    def __init__(self, moves_to_annotate : Chess_moves):
 
-        super().__init__(moves_to_annotate)
-        self.notes = []
-    
+    def __setitem__(self, name, value):
 
+        self.loaded[name] = value
+        self.replaced.add(name)
 
-    def __str__(self):
 
-        output = ''
 
-        for note in self.notes:
+    def __delitem__(self, name):
 
-            output += f'{str(note)} \n\n'
+        if name not in self.loaded and name not in self.load_offsets():
+            raise KeyError(name)
 
+        #Deletion is marked as a replacement with nothing, so the object is dropped from the store on saving.
+        self.loaded.pop(name, None)
+        self.headers.pop(name, None)
+        self.replaced.add(name)
 
 
-    def add_note(self, note : str):
 
-        if self.notes[-1].entry['date'] == datetime.datetime.now().date():
-            self.notes[-1].entry['content'] += '\n\n' + note
+    def __iter__(self):
 
-        else:
-            self.notes.append(Log(note))
+        names = set(self.loaded) | {name for name in self.load_offsets() if name not in self.replaced}
+        return iter(names)
 
 
 
+    def __len__(self):
 
+        return sum(1 for _ in self)
 
-class Book(collections.abc.MutableMapping):
-    """Object for holding notes about arbitrary sequences of chess moves."""
 
-    name : str
-    annotations : dict
 
 
-    def __init__(self, name):
 
-        self.name = name
-    
+class Data_tree:
+    """Object for holding all books, games and line spaces. If given a path, they are persisted to a store there and loaded lazily."""
 
+    books : dict
+    games : dict
+    line_spaces : dict
+    store : storage.Record_store
 
-    def __getitem__(self, key : Chess_moves):
 
-        try:
+    def __init__(self, path : str = None):
 
-            if any(not check_is_move_and_warn(move) for move in key):
-                return
-            
-            if key in self.annotations.keys():
-                return self.annotations[key]
-            
-            else:
-                self.annotations[key] = []
-                return self.annotations[key]
+        if path is None:
+            self.store = None
 
-        except:
-            print("key not iterable sequence of moves.")
+        else:
+            import storage
+            self.store = storage.Record_store(path)
 
+        if self.store is None:
+            self.books, self.games, self.line_spaces = dict(), dict(), dict()
+            return
 
+        #Only the root record is read on opening. Collections and their objects are read on first access.
+        root = self.store.root or dict()
 
-    def __setitem__(self, key : Chess_moves, value):
-        
-        try:
-            if any(not check_is_move_and_warn(move) for move in key):
-                return
-            self.annotations[key] = value
+        self.books = Stored_collection(self.store, 'books', root.get('books'))
+        self.games = Stored_collection(self.store, 'games', root.get('games'))
+        self.line_spaces = Stored_collection(self.store, 'line_spaces', root.get('line_spaces'))
 
-        except:
-            print("key not iterable sequence of moves.")
 
 
+    def commit(self):
+        """Writes every change since the last commit to the store as a single atomic commit."""
 
-    def __delitem__(self, key : Chess_moves):
-        
-        del self.annotations[key]
+        if self.store is None:
+            return
 
+        self.store.commit({collection : getattr(self, collection).save() for collection in ('books', 'games', 'line_spaces')})
 
 
-    def __iter__(self):
-        
-        return iter(self.annotations)
-    
 
+    def close(self):
 
-    def __len__(self):
-        
-        return len(self.annotations)
+        if self.store is not None:
+            self.store.close()
 
 
 
 
 
-class Chess_game(Chess_moves):
-    """Object for holding all data about a game."""
+class Navigation_state:
+    """Object for holding everything worked out about a line being navigated: its position, the continuations each line space offers from it and each book's annotations on it."""
 
+    position : board.Chess_position
+    continuations : dict
+    annotations : dict
 
-    i_was_white: bool
-    did_i_win : bool
-    opponent_elo : float
-    date : dict
-    ending_tag : str
 
+    def __init__(self, position, continuations, annotations):
 
+        self.position = position
+        self.continuations = continuations
+        self.annotations = annotations
 
-    def __init__(self, game_data : str):
-        """Initializer intended to be initialized with chess data from Chess.com"""
 
-        formatted_game_data : list = split_string_list([game_data], '[', ']')
 
 
-        #Generate the list of game moves using base class init.
-        super().__init__(*formatted_game_data)
 
+class Position_cache:
+    """Object for holding the positions reached by recently visited lines, discarding the least recently used once full.
 
-        #Find strings with relevant data.
-        termination_phrase : str = next(phrase for phrase in formatted_game_data if 'Termination' in phrase)
-        date_phrase : str = next(phrase for phrase in formatted_game_data if 'Date' in phrase)
-        white_player_phrases : str = [phrase for phrase in formatted_game_data if 'White' in phrase]
-        black_player_phrases : str = [phrase for phrase in formatted_game_data if 'Black' in phrase]
+    A position depends only on its line, so entries never go stale as line spaces and books are edited."""
 
+    capacity : int
+    entries : collections.OrderedDict
+    hits : int
+    misses : int
 
-        #My name will appear in the white player phrases if I was white.
-        self.i_was_white = 'TheRealYzb25' in ''.join(white_player_phrases)
 
+    def __init__(self, capacity : int = 1024):
 
-        #Find my opponent's ELO in the phrase I wasn't in. It must appear in quotation marks immediately after an ELO tag.
-        if self.i_was_white:
-            black_data : list = split_string_list(black_player_phrases, '"')
-            elo_tag_index : int = next(i for i in range(len(black_data)) if 'Elo' in black_data[i])
-            self.opponent_elo = float(black_data[elo_tag_index + 1])
+        self.capacity = capacity
+        self.entries = collections.OrderedDict()
+        self.hits, self.misses = 0, 0
 
-        else:
-            white_data : list = split_string_list(white_player_phrases, '"')
-            elo_tag_index : int = next(i for i in range(len(white_data)) if 'Elo' in white_data[i])
-            self.opponent_elo = float(white_data[elo_tag_index + 1])
 
 
-        #My name will appear in the termination phrase if I won.
-        self.did_i_win = 'TheRealYzb25' in termination_phrase
+    def get(self, key):
+        """Returns the position cached for a key, marking it as recently used, or None if there is none."""
 
+        position = self.entries.get(key)
 
-        #Look for details about how the game ended in the termination phrase.
-        if 'drawn' in termination_phrase:
-            self.ending_tag = 'draw'
+        if position is None:
+            self.misses += 1
+            return None
 
-        elif 'time' in termination_phrase:
-            self.ending_tag = 'time'
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return position
 
-        elif 'checkmate' in termination_phrase:
-            self.ending_tag = 'checkmate'
 
-        else:
-            self.ending_tag = 'resignation'
-        
 
-        #Derive date details from date data. The details must appear immediately after a date tag.
-        date_data : list = split_string_list([date_phrase], '"')
-        date_tag_index : int = next(i for i in range(len(date_data)) if 'Date' in date_data[i])
-        final_date_data = date_data[date_tag_index + 1].split('.')
+    def put(self, key, position):
 
-        self.date = dict()
-        self.date['Year'], self.date['Month'], self.date['Day'] = final_date_data[0], final_date_data[1], final_date_data[2]
+        self.entries[key] = position
+        self.entries.move_to_end(key)
 
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last = False)
 
 
-    def __str__(self):
 
-        my_colour = 'White' if self.i_was_white else 'Black'
-        win_state = 'victory' if self.did_i_win else 'defeat'
-        game_summary = 'was drawn' if self.ending_tag == 'drawn' else \
-            f'ended in {win_state} by {self.ending_tag}'
-        moves = super().__str__()
+    def clear(self):
 
-        output : str =  f'''{self.date['Day']}/{self.date['Month']}/{self.date['Year']}
-Game as {my_colour} {game_summary}. Opponent ELO was {self.opponent_elo}
-Move details:
-{moves}'''
+        self.entries.clear()
 
-        return output
 
 
+    def __len__(self):
 
+        return len(self.entries)
 
 
-class Line_space(collections.abc.MutableSet):
-    """Object for holding data about preferred chess lines."""
 
+    def __str__(self):
 
-    name : str
-    is_white : bool
-    lines : set
-    u_num : int
+        return f'{len(self.entries)}/{self.capacity} positions cached, {self.hits} hits, {self.misses} misses.'
 
 
-    def __init__(self, name, is_white, lines):
 
-        self.name = name
-        self.is_white = is_white
-        self.u_num = 0
 
-        #For any line in the line space, all its sub-lines should also be present.
-        take_sub_lines = lambda line : { line[:n] for n in range(len(line) + 1) }
-        self.lines = set.union( *(take_sub_lines(line) for line in lines) )
 
+class Node(Data_tree):
 
+    address : Chess_moves
+    cache : Position_cache
 
-    def is_your_move(self, move_number : int):
-        """Verifies if it is our move based on move number our colour."""
+
+    def __init__(self, data, cache_capacity : int = 1024):
         
-        #If move_number is even, it is black's turn.
-        return (move_number % 2) != self.is_white
-    
+        self.data = data
+        self.address = Chess_moves()
+        self.cache = Position_cache(cache_capacity)
 
 
-    def filter_for_length(self, length : int):
 
-        return {line[:length] for line in self.lines if len(line) >= length}
-    
+    def __getitem__(self, key):
 
+        if key == '..':
+            del self.address[-1]
 
-    def get_continuations(self, line):
+        else:
+            self.address.add_move(key)
 
-        return {l for l in self.filter_for_length(len(line) + 1) if l[:len(line)] == line}
+        return self.state()
     
 
 
-    def __contains__(self, line):
-        """Extends standard set behaviour to Line_space."""
+    def travel(self, *keys):
 
-        return True if line in self.lines else False
-    
+        for key in keys:
+            self[key]
 
+        return self.state()
 
-    def __iter__(self):
-        """Extends standard set behaviour to Line_space."""
-        
-        return iter(self.lines)
-    
 
 
-    def __len__(self):
-        """Extends standard set behaviour to Line_space."""
-        
-        return len(self.lines)
-    
+    def position(self, line : Chess_moves = None):
+        """Returns the position a line reaches, by default the current address, or None if the line is illegal.
 
+        The position is the caller's own copy, so it may be played on freely."""
 
-    def add(self, line):
-        """Extends standard set behaviour to Line_space."""
-        
-        #Ensure all sublines of the added line are also added.
-        take_sub_lines = lambda line : { line[:n] for n in range(len(line) + 1) }
-        self.lines |= take_sub_lines(line)
+        position = self.cached_position(line)
+        return None if position is None else position.copy()
 
 
 
-    def discard(self, line_to_discard):
-        """Extends standard set behaviour to Line_space."""
+    def cached_position(self, line : Chess_moves = None):
+        """Returns the cached position a line reaches, working it out and caching it if needed, or None if the line is illegal.
 
-        #Discard any lines for which the discarded line is a subline.
-        condition = lambda line : line[ : len(line_to_discard) ] != line_to_discard
-        self.lines = {line for line in self.lines if not condition}
-    
+        The position is shared with every node using the same cache, so it must not be changed."""
 
+        line = self.address if line is None else line
+        key = line.code_bytes()
 
+        position = self.cache.get(key)
 
+        if position is not None:
+            return position
 
-class Unique_line_space(Line_space):
-    """Object for holding data about preferred chess line, but a single unique response to each opponent move is necessitated, for moves greater than a certain "uniqueness_number"."""
+        #The position is worked out from the position of the line one move shorter if that is cached, and otherwise replayed from the start.
+        parent = self.cache.get(line[:-1].code_bytes()) if len(line) else None
 
+        try:
+            if parent is not None:
+                position = parent.copy()
+                position.push_san(line[-1])
 
-    def __init__(self, name, is_white, lines, uniqueness_number):
-        
-        super().__init__(name, is_white, lines)
-        super().u_num = uniqueness_number
+            else:
+                import board
+                position = board.replay(line)
 
-        uniqueness_iter = iter(line for line in super().lines if not self.check_uniqueness(line))
+        #Illegal lines are not cached, as they are rarely visited.
+        except ValueError:
+            return None
 
-        while True:
+        self.cache.put(key, position)
+        return position
 
-            try: super().discard(next(uniqueness_iter))
-            except: break
 
 
+    def state(self, line : Chess_moves = None) -> Navigation_state:
+        """Returns the navigation state of a line, by default the current address.
 
-    def add(self, line):
+        Only the position is cached. Continuations and annotations are read from the line spaces and books as they are now, so edits are always seen.
+        Spaces and books keyed by position look up the cached position's hash rather than replaying the line."""
 
-        super().add(line)
-        subline_of = lambda l, m : any(m[0:n] == l for n in range(len(m)) + 1)
-        uniqueness_iter = iter(l for l in super().lines if not self.check_uniqueness(l) and not subline_of(l, line))
+        line = self.address if line is None else line
+        position = self.cached_position(line)
+        zobrist = None if position is None else position.zobrist
 
-        while True:
+        line_spaces = getattr(self.data, 'line_spaces', dict())
+        books = getattr(self.data, 'books', dict())
 
-            try: super().discard(next(uniqueness_iter))
-            except: break
-    
+        continuations = {name : [move for continuation in space.get_continuations(line, zobrist) for move in continuation[-1:]] for name, space in line_spaces.items()}
+        annotations = {name : book.annotations.get(book.annotation_key(line, zobrist)) for name, book in books.items() if position is not None or not book.by_position}
 
+        #The state is handed to the caller, so it holds a copy of the cached position.
+        return Navigation_state(None if position is None else position.copy(), continuations, annotations)
 
-    def check_uniqueness(self, line):
 
-        uniqueness_is_needed = lambda num : divmod(num, 2)[0] + 1 >= self.u_num
-        is_opponent_turn = lambda num : not super().is_your_turn(num)
 
-        for move_num in range(len(line)):
-            if uniqueness_is_needed(move_num) and is_opponent_turn(move_num):
-                if len( {l for l in super().lines if len(l) == move_num + 1 and l[:move_num] == line} ) > 1:
-                    return False
-        
-        return True
-    
 
-    def find_contradicting_line(self, line):
 
-        uniqueness_is_needed = lambda num : divmod(num, 2)[0] + 1 >= self.u_num
-        
-        for move_num in range(len(line)):
-            if uniqueness_is_needed(move_num) and super().is_your_turn(move_num):
-                if not self.get_continuations(line[:move_num]).issubset({line[:move_num + 1]}):
-                    return next( iter( self.get_continuations(line[:move_num]) ) )
+#The arguments each batch command takes, in the order they are written in a script. The last argument of a script command takes the rest of its line.
+batch_arguments = {'goto' : ['line'], 'move' : ['line'], 'back' : ['plies'],
+                   'use_line_space' : ['name'], 'use_book' : ['name'], 'new_line_space' : ['name', 'colour'], 'new_book' : ['name'],
+                   'add_line' : ['line'], 'discard_line' : ['line'], 'add_note' : ['note'], 'delete_annotation' : []}
 
-        return None
+#Arguments which may be left out of a command.
+optional_batch_arguments = {'line', 'plies'}
 
 
 
+class Batch_command:
+    """Object for holding one command of a batch, along with where it was read from."""
 
+    op : str
+    arguments : dict
+    source : str
 
-class Data_tree:
 
-    books : dict
-    games : dict
-    line_spaces : dict
+    def __init__(self, op : str, arguments : dict, source : str):
 
+        self.op = op
+        self.arguments = arguments
+        self.source = source
 
 
 
+    def __str__(self):
 
-class Node(Data_tree):
+        return self.source
 
-    address : Chess_moves
 
 
-    def __init__(self, data):
-        
-        self.data = data
+def parse_batch(lines) -> list:
+    """Reads batch commands from lines of a script, or of JSON objects with an 'op' field and the command's arguments.
 
+    In a script, each line is a command followed by its arguments, e.g. 'add_line 1. e4 e5 2. Nf3'. Blank lines and lines starting with # are skipped."""
 
+    commands = []
 
-    def __getitem__(self, key):
+    for number, text in enumerate(lines, start = 1):
 
-        if key == '..':
-            del self.address[-1]
+        text = text.strip()
 
-        else:
-            self.address.add_move(key)
-    
+        if not text or text.startswith('#'):
+            continue
 
+        source = f'line {number}: {text}'
 
-    def travel(self, *keys):
+        if text.startswith('{'):
+            import json
+            arguments = json.loads(text)
+            commands.append(Batch_command(arguments.pop('op', None), arguments, source))
+            continue
 
-        for key in keys:
-            self[key]
+        op, _, rest = text.partition(' ')
+        names = batch_arguments.get(op, [])
+        values = rest.split(None, len(names) - 1) if names else []
+
+        commands.append(Batch_command(op, dict(zip(names, values)), source))
+
+    return commands
 
 
 
@@ -589,9 +3263,15 @@ class Node_traverser:
     default_book : Book
 
 
-    def __init__(self, data):
+    def __init__(self, data, interactive : bool = True):
 
         self.node = Node(data)
+        self.default_line_space = None
+        self.default_book = None
+
+        #A traverser which is not interactive is driven by run_batch instead of the menu.
+        if not interactive:
+            return
 
         print('Program start. \n\n')
 
@@ -698,6 +3378,252 @@ class Node_traverser:
 
 
 
+    def run_batch(self, commands : list) -> list:
+        """Applies a list of batch commands as a single transaction, returning (command, seconds taken) pairs.
+
+        Every command is checked before any is applied, and a ValueError listing every problem is raised if any are invalid.
+        If a command fails part way through, every object it touched is restored. The batch is committed to the data's store once all have been applied."""
+
+        self.validate_batch(commands)
+
+        data = self.node.data
+        #The address is copied, as commands like back change it in place.
+        address, line_space, book = Chess_moves(self.node.address), self.default_line_space, self.default_book
+
+        #Copies are kept of everything the batch will change, so it can be undone.
+        touched = {('line_spaces', command.arguments.get('name')) for command in commands if command.op in ('use_line_space', 'new_line_space')}
+        touched |= {('books', command.arguments.get('name')) for command in commands if command.op in ('use_book', 'new_book')}
+
+        if line_space is not None:
+            touched.add(('line_spaces', line_space.name))
+
+        if book is not None:
+            touched.add(('books', book.name))
+
+        import copy
+        import time
+
+        saved = {(collection, name) : getattr(data, collection).get(name) for collection, name in touched}
+        copies = {key : value.copy() if isinstance(value, Line_space) else copy.deepcopy(value) for key, value in saved.items() if value is not None}
+
+        timings = []
+
+        try:
+            for command in commands:
+
+                start = time.perf_counter()
+                self.apply_command(command)
+                timings.append((command, time.perf_counter() - start))
+
+        except Exception:
+
+            for (collection, name), value in saved.items():
+
+                if value is None:
+                    getattr(data, collection).pop(name, None)
+
+                else:
+                    getattr(data, collection)[name] = copies[(collection, name)]
+
+            self.node.address = address
+            self.default_line_space = None if line_space is None else data.line_spaces[line_space.name]
+            self.default_book = None if book is None else data.books[book.name]
+            raise
+
+        data.commit()
+
+        return timings
+
+
+
+    def validate_batch(self, commands : list):
+        """Checks every command of a batch could be applied, following the moves and defaults it would set without changing anything."""
+
+        import board
+
+        data = self.node.data
+        line_spaces, books = set(data.line_spaces), set(data.books)
+        line_space = None if self.default_line_space is None else self.default_line_space.name
+        book = None if self.default_book is None else self.default_book.name
+        address = list(self.node.address)
+        problems = []
+
+        for command in commands:
+
+            arguments = command.arguments
+
+            if command.op not in batch_arguments:
+                problems.append(f'{command.source}: unknown command {command.op}.')
+                continue
+
+            missing = [name for name in batch_arguments[command.op] if name not in arguments and name not in optional_batch_arguments]
+
+            if missing:
+                problems.append(f"{command.source}: missing {', '.join(missing)}.")
+                continue
+
+            try:
+                line = address if arguments.get('line') is None else batch_line(arguments['line'])
+
+                if command.op == 'move':
+                    line = address + line
+
+                if 'line' in batch_arguments[command.op]:
+                    board.replay(line)
+
+                if command.op == 'back':
+                    plies = batch_plies(arguments.get('plies', 1))
+
+            except ValueError as error:
+                problems.append(f'{command.source}: {error}')
+                continue
+
+            match command.op:
+
+                case 'goto' | 'move':
+                    address = line
+
+                case 'back':
+
+                    if plies > len(address):
+                        problems.append(f'{command.source}: cannot go back past the start of the game.')
+                    else:
+                        address = address[:len(address) - plies]
+
+                case 'use_line_space' | 'use_book':
+
+                    names, kind = (line_spaces, 'line space') if command.op == 'use_line_space' else (books, 'book')
+
+                    if arguments['name'] not in names:
+                        problems.append(f"{command.source}: no {kind} named {arguments['name']}.")
+
+                    elif command.op == 'use_line_space':
+                        line_space = arguments['name']
+
+                    else:
+                        book = arguments['name']
+
+                case 'new_line_space':
+
+                    if arguments['colour'] not in ('white', 'black'):
+                        problems.append(f"{command.source}: colour must be white or black, not {arguments['colour']}.")
+                    else:
+                        line_spaces.add(arguments['name'])
+
+                case 'new_book':
+                    books.add(arguments['name'])
+
+                case 'add_line' | 'discard_line':
+
+                    if line_space is None:
+                        problems.append(f'{command.source}: no line space has been chosen.')
+
+                case 'add_note' | 'delete_annotation':
+
+                    if book is None:
+                        problems.append(f'{command.source}: no book has been chosen.')
+
+        if problems:
+            raise ValueError('Batch is invalid:\n' + '\n'.join(problems))
+
+
+
+    def apply_command(self, command : Batch_command):
+
+        data = self.node.data
+        arguments = command.arguments
+        line = self.node.address if arguments.get('line') is None else Chess_moves(*batch_line(arguments['line']))
+
+        match command.op:
+
+            case 'goto':
+                self.node.address = Chess_moves(line)
+
+            case 'move':
+                self.node.address = Chess_moves(*self.node.address, *line)
+
+            case 'back':
+                del self.node.address[len(self.node.address) - batch_plies(arguments.get('plies', 1)):]
+
+            case 'use_line_space':
+                self.default_line_space = data.line_spaces[arguments['name']]
+
+            case 'use_book':
+                self.default_book = data.books[arguments['name']]
+
+            case 'new_line_space':
+                data.line_spaces[arguments['name']] = Line_space(arguments['name'], arguments['colour'] == 'white', [])
+
+            case 'new_book':
+                data.books[arguments['name']] = Book(arguments['name'])
+
+            case 'add_line':
+                self.default_line_space.add(line)
+
+            case 'discard_line':
+                self.default_line_space.discard(line)
+
+            case 'add_note':
+
+                annotations = self.default_book[line]
+
+                if not annotations:
+                    annotations.append(Annotation(line))
+
+                annotations[-1].add_note(arguments['note'])
+
+            case 'delete_annotation':
+
+                if line in self.default_book:
+                    del self.default_book[line]
+
+
+
+
+
+def batch_plies(plies) -> int:
+    """Reads the number of plies a back command goes back by, given as a number or as text. Raises ValueError unless it is a whole number, zero or more."""
+
+    if isinstance(plies, bool) or not isinstance(plies, (int, str)) or not str(plies).strip().isdigit():
+        raise ValueError('plies must be a whole number of zero or more.')
+
+    return int(plies)
+
+
+
+def batch_line(line) -> list:
+    """Returns the moves of a line given to a batch command, either as a list of moves or as a string of moves with optional move numbers.
+
+    Raises ValueError naming anything which is neither a move nor a move number, so a mistyped move is reported rather than dropped."""
+
+    if isinstance(line, list):
+        moves = list(line)
+        unreadable = [move for move in moves if not isinstance(move, str) or not check_is_move(move)]
+
+    else:
+        moves, unreadable, position = [], [], 0
+
+        #Text between tokens, and tokens of any other kind, such as results or comments, are not part of a line.
+        for match in compiled('token').finditer(line):
+
+            unreadable.extend(line[position:match.start()].split())
+            position = match.end()
+
+            if match.lastgroup == 'move':
+                moves.append(match.group('move'))
+
+            elif match.lastgroup != 'move_number':
+                unreadable.append(match.group())
+
+        unreadable.extend(line[position:].split())
+
+    if unreadable:
+        raise ValueError(f"not moves: {', '.join(map(str, unreadable))}.")
+
+    return moves
+
+
+
 
 
             
@@ -708,6 +3634,29 @@ class Node_traverser:
 
 
 if __name__ == '__main__':
+
+    #Usage: python chess.py --batch store_path [script_path]. The script is read from standard input if no path is given.
+    if sys.argv[1:2] == ['--batch']:
+
+        #The module is imported under its own name, so objects saved to the store can be read back by other programs.
+        import chess
+
+        data = chess.Data_tree(sys.argv[2])
+
+        with open(sys.argv[3]) if len(sys.argv) > 3 else sys.stdin as script:
+            commands = chess.parse_batch(script)
+
+        try:
+            for command, seconds in chess.Node_traverser(data, interactive = False).run_batch(commands):
+                print(f'{seconds * 1e3:9.3f} ms  {command}')
+
+        except ValueError as error:
+            sys.exit(str(error))
+
+        finally:
+            data.close()
+
+        sys.exit()
     
 
     # games = []
@@ -0,0 +1,170 @@
+import numpy as np
+
+
+
+
+
+def factorize(column : np.ndarray):
+    """Returns the distinct values of a column and, for each entry, the index of its value among them.
+
+    Integer and date columns spanning a small range are coded by offset from their minimum, which avoids sorting."""
+
+    is_date = np.issubdtype(column.dtype, np.datetime64)
+
+    if len(column) and (is_date and not np.isnat(column).any() or np.issubdtype(column.dtype, np.integer)):
+
+        integers = column.view(np.int64) if is_date else column.astype(np.int64)
+        lowest, highest = integers.min(), integers.max()
+
+        if highest - lowest < 4 * len(column) + 1024:
+            return np.arange(lowest, highest + 1).astype(column.dtype), integers - lowest
+
+    return np.unique(column, return_inverse = True)
+
+
+
+
+
+class Game_table:
+    """Object for holding the details of many games as columns, for vectorized filtering and aggregation.
+
+    Each column is a NumPy array with one entry per game. Ending tags are stored as codes into the list of ending_tags."""
+
+    opponent_elo : np.ndarray
+    date : np.ndarray
+    i_was_white : np.ndarray
+    did_i_win : np.ndarray
+    ending_code : np.ndarray
+    ending_tags : np.ndarray
+
+
+    def __init__(self, games = ()):
+        """Initializer accepts any iterable of Chess_game objects, which is read in a single pass."""
+
+        elos, dates, whites, wins, endings = [], [], [], [], []
+
+        for game in games:
+
+            elos.append(game.opponent_elo)
+            whites.append(game.i_was_white)
+            wins.append(game.did_i_win)
+            endings.append(game.ending_tag)
+
+            #Unknown PGN dates such as '????.??.??' are stored as not-a-time.
+            date = f"{game.date['Year']}-{game.date['Month']}-{game.date['Day']}"
+            dates.append('NaT' if '?' in date else date)
+
+        self.opponent_elo = np.array(elos, dtype = np.float64)
+        self.date = np.array(dates, dtype = 'datetime64[D]')
+        self.i_was_white = np.array(whites, dtype = bool)
+        self.did_i_win = np.array(wins, dtype = bool)
+
+        #Ending tags are categorical, so each distinct tag is stored once and each game holds a small code.
+        self.ending_tags, ending_code = np.unique(np.array(endings, dtype = str), return_inverse = True)
+        self.ending_code = ending_code.astype(np.int16)
+
+
+
+    @classmethod
+    def from_columns(cls, opponent_elo, date, i_was_white, did_i_win, ending_code, ending_tags):
+        """Builds a table directly from its columns, without reading any games."""
+
+        table = cls.__new__(cls)
+
+        table.opponent_elo, table.date, table.i_was_white = opponent_elo, date, i_was_white
+        table.did_i_win, table.ending_code, table.ending_tags = did_i_win, ending_code, ending_tags
+
+        return table
+
+
+
+    def __len__(self):
+
+        return len(self.opponent_elo)
+
+
+
+    def __getitem__(self, selection):
+        """Returns a table of the games picked by a boolean mask, an array of indices or a slice."""
+
+        return Game_table.from_columns(self.opponent_elo[selection], self.date[selection], self.i_was_white[selection],
+                                       self.did_i_win[selection], self.ending_code[selection], self.ending_tags)
+
+
+
+    def ending_is(self, tag : str) -> np.ndarray:
+        """Returns a mask of the games which ended with the given tag."""
+
+        matches = np.flatnonzero(self.ending_tags == tag)
+
+        if len(matches) == 0:
+            return np.zeros(len(self), dtype = bool)
+
+        return self.ending_code == matches[0]
+
+
+
+    def played_between(self, start = None, end = None) -> np.ndarray:
+        """Returns a mask of the games played between the given dates, inclusive. Either end may be left open."""
+
+        mask = ~np.isnat(self.date)
+
+        if start is not None:
+            mask &= self.date >= np.datetime64(start, 'D')
+
+        if end is not None:
+            mask &= self.date <= np.datetime64(end, 'D')
+
+        return mask
+
+
+
+    def elo_bucket(self, width : int = 100) -> np.ndarray:
+        """Returns the lower bound of the ELO bucket of the given width that each opponent falls in."""
+
+        return (np.floor(self.opponent_elo / width) * width).astype(np.int64)
+
+
+
+    def month(self) -> np.ndarray:
+        """Returns the month each game was played in."""
+
+        return self.date.astype('datetime64[M]')
+
+
+
+    def aggregate(self, keys : list, values : np.ndarray):
+        """Groups the games by the given key columns and totals the given values within each group.
+
+        Returns the key columns of each group, the number of games in each group and the total of the values in each group."""
+
+        #Each key column is reduced to codes, which are combined into a single code per game identifying its group.
+        uniques, codes = zip(*(factorize(np.asarray(key)) for key in keys))
+        shape = tuple(len(unique) for unique in uniques)
+        group_code = np.ravel_multi_index(codes, shape)
+
+        #Groups are counted by code directly where there are few enough possible groups, so no sorting is needed.
+        if np.prod(shape, dtype = np.float64) < 4 * len(group_code) + 1024:
+            counts = np.bincount(group_code, minlength = int(np.prod(shape)))
+            totals = np.bincount(group_code, weights = values, minlength = len(counts))
+            groups = np.flatnonzero(counts)
+            counts, totals = counts[groups], totals[groups]
+
+        else:
+            groups, group_of_game = np.unique(group_code, return_inverse = True)
+            counts = np.bincount(group_of_game, minlength = len(groups))
+            totals = np.bincount(group_of_game, weights = values, minlength = len(groups))
+
+        group_keys = [unique[index] for unique, index in zip(uniques, np.unravel_index(groups, shape))]
+
+        return group_keys, counts, totals
+
+
+
+    def win_rate_by(self, *keys):
+        """Returns the key columns of each group, the number of games in each group and the proportion of them I won.
+
+        For example, table.win_rate_by(table.elo_bucket(100), table.month()) gives the win rate by opponent ELO bucket per month."""
+
+        group_keys, counts, wins = self.aggregate(list(keys), self.did_i_win.astype(np.float64))
+        return group_keys, counts, wins / counts
@@ -0,0 +1,288 @@
+import bisect
+import contextlib
+import cProfile
+import functools
+import pstats
+import runpy
+import sys
+import time
+import tracemalloc
+
+
+
+
+
+#Upper bounds, in seconds, of the buckets call durations are counted into.
+duration_buckets = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 0.1, 1.0)
+
+
+
+
+
+class Call_metrics:
+    """Object for holding the number of calls to a function, the total time spent in it and a histogram of call durations."""
+
+    __slots__ = ('calls', 'total', 'longest', 'buckets')
+
+    calls : int
+    total : float
+    longest : float
+    buckets : list
+
+
+    def __init__(self):
+
+        self.calls = 0
+        self.total = 0.0
+        self.longest = 0.0
+
+        #The last bucket counts calls longer than every bound.
+        self.buckets = [0] * (len(duration_buckets) + 1)
+
+
+
+    def observe(self, duration : float):
+
+        self.calls += 1
+        self.total += duration
+        self.longest = max(self.longest, duration)
+        self.buckets[bisect.bisect_left(duration_buckets, duration)] += 1
+
+
+
+    def quantile(self, fraction : float) -> float:
+        """Returns the upper bound of the bucket holding the given fraction of calls, as an estimate of that quantile of durations."""
+
+        target, seen = fraction * self.calls, 0
+
+        for bound, count in zip(duration_buckets, self.buckets):
+
+            seen += count
+
+            if seen >= target:
+                return min(bound, self.longest)
+
+        return self.longest
+
+
+
+
+
+#Metrics gathered for each instrumented function, keyed by name. Zeroed in place by reset().
+metrics : dict = dict()
+
+#The original attribute of each instrumented function while instrumentation is enabled, keyed by owner and attribute name.
+originals : dict = dict()
+
+
+
+def default_targets() -> list:
+    """Returns the hot paths instrumented by default, as (owner, attribute name) pairs."""
+
+    import chess
+
+    return [(chess, 'check_is_move'), (chess, 'split_string_list'), (chess, 'parse_pgn'),
+            (chess.Chess_moves, '__init__'),
+            (chess.Line_space, '__contains__'), (chess.Line_space, 'get_continuations'), (chess.Line_space, 'find_node'),
+            (chess.Line_space, 'add'), (chess.Line_space, 'discard'), (chess.Unique_line_space, 'add'),
+            (chess.Book, '__getitem__'), (chess.Book, '__setitem__'), (chess.Book, 'annotations_along')]
+
+
+
+def timed(function, name : str):
+    """Returns a wrapper around a function which records each call to it under the given name."""
+
+    call_metrics = metrics.setdefault(name, Call_metrics())
+    clock = time.perf_counter
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+
+        start = clock()
+
+        try:
+            return function(*args, **kwargs)
+
+        finally:
+            call_metrics.observe(clock() - start)
+
+    return wrapper
+
+
+
+def enable(targets : list = None):
+    """Starts recording calls to the given functions, or to the default hot paths.
+
+    Functions are only wrapped while instrumentation is enabled, so it costs nothing once disabled."""
+
+    for owner, attribute in default_targets() if targets is None else targets:
+
+        if (owner, attribute) in originals:
+            continue
+
+        #Functions are looked up on the owner itself, so a subclass overriding a method is wrapped separately from its parent.
+        function = vars(owner)[attribute]
+        originals[(owner, attribute)] = function
+        setattr(owner, attribute, timed(function, f'{getattr(owner, "__name__", owner)}.{attribute}'))
+
+
+
+def disable():
+    """Stops recording calls, restoring every instrumented function. Metrics gathered so far are kept."""
+
+    for (owner, attribute), function in originals.items():
+        setattr(owner, attribute, function)
+
+    originals.clear()
+
+
+
+def reset():
+    """Sets the metrics gathered so far back to zero. Metrics are reset in place, as wrapped functions keep recording into them while enabled."""
+
+    for call_metrics in metrics.values():
+        call_metrics.__init__()
+
+
+
+@contextlib.contextmanager
+def instrumented(targets : list = None):
+    """Records calls to the given functions, or to the default hot paths, for the duration of a with block."""
+
+    enable(targets)
+
+    try:
+        yield metrics
+
+    finally:
+        disable()
+
+
+
+def summary() -> str:
+    """Returns a table of the metrics gathered so far, slowest in total first."""
+
+    rows = [f"{'function':<36}{'calls':>10}{'total ms':>12}{'mean us':>10}{'p50 us':>10}{'p99 us':>10}{'max us':>10}"]
+
+    for name, call_metrics in sorted(metrics.items(), key = lambda item : -item[1].total):
+
+        if not call_metrics.calls:
+            continue
+
+        rows.append(f'{name:<36}{call_metrics.calls:>10}{call_metrics.total * 1e3:>12.2f}{call_metrics.total / call_metrics.calls * 1e6:>10.2f}'
+                    f'{call_metrics.quantile(0.5) * 1e6:>10.1f}{call_metrics.quantile(0.99) * 1e6:>10.1f}{call_metrics.longest * 1e6:>10.1f}')
+
+    return '\n'.join(rows)
+
+
+
+def prometheus_text() -> str:
+    """Returns the metrics gathered so far in the Prometheus text exposition format, as a histogram of call durations per function."""
+
+    lines = ['# HELP chess_call_duration_seconds Time spent in instrumented functions.', '# TYPE chess_call_duration_seconds histogram']
+
+    for name, call_metrics in sorted(metrics.items()):
+
+        cumulative = 0
+
+        for bound, count in zip(duration_buckets, call_metrics.buckets):
+            cumulative += count
+            lines.append(f'chess_call_duration_seconds_bucket{{function="{name}",le="{bound}"}} {cumulative}')
+
+        lines.append(f'chess_call_duration_seconds_bucket{{function="{name}",le="+Inf"}} {call_metrics.calls}')
+        lines.append(f'chess_call_duration_seconds_sum{{function="{name}"}} {call_metrics.total}')
+        lines.append(f'chess_call_duration_seconds_count{{function="{name}"}} {call_metrics.calls}')
+
+    return '\n'.join(lines) + '\n'
+
+
+
+def write_prometheus(path : str):
+
+    with open(path, 'w') as file:
+        file.write(prometheus_text())
+
+
+
+@contextlib.contextmanager
+def profiled(kind : str = 'cprofile', limit : int = 25, output = None):
+    """Runs the body of a with block under cProfile or tracemalloc, printing the top entries once it finishes.
+
+    kind is 'cprofile' for time spent per function, or 'tracemalloc' for memory allocated per line."""
+
+    output = sys.stdout if output is None else output
+
+    if kind == 'cprofile':
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+        try:
+            yield profiler
+
+        finally:
+            profiler.disable()
+            pstats.Stats(profiler, stream = output).sort_stats('cumulative').print_stats(limit)
+
+    elif kind == 'tracemalloc':
+
+        tracemalloc.start()
+
+        try:
+            yield None
+
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            print(f'Memory allocated: {current / 1024:,.0f} KiB, peaking at {peak / 1024:,.0f} KiB.', file = output)
+
+            for statistic in snapshot.statistics('lineno')[:limit]:
+                print(statistic, file = output)
+
+    else:
+        raise ValueError(f'Unknown profiler {kind}, expected cprofile or tracemalloc.')
+
+
+
+
+
+if __name__ == '__main__':
+
+    #Usage: python instrumentation.py [--profile cprofile|tracemalloc] [--prometheus path] script.py [arguments]
+    #Runs a script which imports chess with the hot paths instrumented, then prints a summary of them.
+    arguments = sys.argv[1:]
+    profile_kind, prometheus_path = None, None
+
+    while arguments and arguments[0].startswith('--'):
+
+        flag, value = arguments[0], arguments[1]
+        arguments = arguments[2:]
+
+        if flag == '--profile':
+            profile_kind = value
+
+        elif flag == '--prometheus':
+            prometheus_path = value
+
+        else:
+            sys.exit(f'Unknown flag {flag}.')
+
+    if not arguments:
+        sys.exit('No script given to run.')
+
+    sys.argv = arguments
+
+    with contextlib.ExitStack() as stack:
+
+        if profile_kind is not None:
+            stack.enter_context(profiled(profile_kind))
+
+        stack.enter_context(instrumented())
+        runpy.run_path(arguments[0], run_name = '__main__')
+
+    print(summary())
+
+    if prometheus_path is not None:
+        write_prometheus(prometheus_path)
@@ -0,0 +1,553 @@
+import datetime
+import json
+import chess
+
+
+
+
+
+#Every file starts with the magic bytes, the format version and a byte giving the kind of object it holds.
+magic = b'CHRP'
+format_version = 2
+line_space_kind = b'L'
+book_kind = b'B'
+
+#Kinds of annotation value held in a book record. Version 1 pickled any other value. Such values are refused when read, as unpickling a file can run arbitrary code.
+annotations_value = 0
+pickled_value = 1
+json_value = 2
+
+
+
+
+
+class Binary_writer:
+    """Object for writing the parts of the format to a binary stream as they are produced, so nothing is built up in memory.
+
+    Moves are written as small integers. The first time a move is used it is written as 0 followed by its name, and later uses refer to it by number."""
+
+    stream : object
+    move_numbers : dict
+
+
+    def __init__(self, stream, kind : bytes):
+
+        self.stream = stream
+        self.move_numbers = dict()
+        stream.write(magic + bytes([format_version]) + kind)
+
+
+
+    def varint(self, value : int):
+        """Writes a non-negative integer in seven bit groups, least significant first, with the top bit marking that more follow."""
+
+        data = bytearray()
+
+        while value >= 0x80:
+            data.append(value & 0x7F | 0x80)
+            value >>= 7
+
+        data.append(value)
+        self.stream.write(data)
+
+
+
+    def bytes(self, value : bytes):
+
+        self.varint(len(value))
+        self.stream.write(value)
+
+
+
+    def string(self, value : str):
+
+        self.bytes(value.encode('utf-8'))
+
+
+
+    def move(self, move : str):
+
+        number = self.move_numbers.get(move)
+
+        if number is None:
+            self.move_numbers[move] = len(self.move_numbers) + 1
+            self.varint(0)
+            self.string(move)
+
+        else:
+            self.varint(number)
+
+
+
+
+
+class Binary_reader:
+    """Object for reading the parts of the format back from a binary stream, in the order they were written."""
+
+    stream : object
+    moves : list
+
+
+    def __init__(self, stream, kind : bytes):
+
+        self.stream = stream
+        self.moves = [None]
+
+        header = stream.read(len(magic) + 2)
+
+        if header[:len(magic)] != magic:
+            raise ValueError('Stream is not in the chess repertoire format.')
+
+        if header[len(magic)] > format_version:
+            raise ValueError(f'Stream is in version {header[len(magic)]} of the format, but only versions up to {format_version} can be read.')
+
+        if header[len(magic) + 1:] != kind:
+            raise ValueError(f'Stream holds kind {header[len(magic) + 1:]!r}, not {kind!r}.')
+
+
+
+    def varint(self) -> int:
+
+        value, shift = 0, 0
+
+        while True:
+
+            byte = self.stream.read(1)
+
+            if not byte:
+                raise ValueError('Stream ended part way through a record.')
+
+            value |= (byte[0] & 0x7F) << shift
+            shift += 7
+
+            if byte[0] < 0x80:
+                return value
+
+
+
+    def bytes(self) -> bytes:
+
+        length = self.varint()
+        data = self.stream.read(length)
+
+        if len(data) != length:
+            raise ValueError('Stream ended part way through a record.')
+
+        return data
+
+
+
+    def string(self) -> str:
+
+        return self.bytes().decode('utf-8')
+
+
+
+    def move(self) -> str:
+
+        number = self.varint()
+
+        if number == 0:
+            self.moves.append(self.string())
+            return self.moves[-1]
+
+        return self.moves[number]
+
+
+
+
+
+def write_line_space(space : chess.Line_space, stream):
+    """Writes a line space to a binary stream as its tree of moves, each node once, in depth first order.
+
+    Each node is written as its number of children, then each child's move followed by the child itself. Only the path being written is held in memory."""
+
+    writer = Binary_writer(stream, line_space_kind)
+
+    writer.string(space.name)
+    writer.varint(space.is_white)
+    writer.varint(isinstance(space, chess.Unique_line_space))
+    writer.varint(space.u_num)
+    writer.varint(space.positions is not None)
+    writer.varint(space.root is not None)
+
+    if space.root is None:
+        return
+
+    #Each entry on the stack is an iterator over the children of a node still being written.
+    writer.varint(len(space.root.children))
+    stack = [iter(space.root.children.items())]
+
+    while stack:
+
+        child = next(stack[-1], None)
+
+        if child is None:
+            stack.pop()
+            continue
+
+        move, node = child
+        writer.move(move)
+        writer.varint(len(node.children))
+        stack.append(iter(node.children.items()))
+
+
+
+def read_line_header(reader : Binary_reader) -> dict:
+
+    return {'name' : reader.string(), 'is_white' : bool(reader.varint()), 'unique' : bool(reader.varint()),
+            'u_num' : reader.varint(), 'by_position' : bool(reader.varint()), 'has_root' : bool(reader.varint())}
+
+
+
+def read_lines(stream):
+    """Yields the moves of each line of a line space written by write_line_space, as tuples, without building the space.
+
+    Only the line being read is held in memory, so lines can be passed on to another space or store as they arrive."""
+
+    reader = Binary_reader(stream, line_space_kind)
+
+    if not read_line_header(reader)['has_root']:
+        return
+
+    yield ()
+
+    #Each entry counts the children of a node on the current path still to be read.
+    line, remaining = [], [reader.varint()]
+
+    while remaining:
+
+        if remaining[-1] == 0:
+
+            remaining.pop()
+
+            if line:
+                line.pop()
+
+            continue
+
+        remaining[-1] -= 1
+        line.append(reader.move())
+        yield tuple(line)
+        remaining.append(reader.varint())
+
+
+
+def read_line_space(stream) -> chess.Line_space:
+    """Reads a line space written by write_line_space, building its tree directly from the stream."""
+
+    reader = Binary_reader(stream, line_space_kind)
+    header = read_line_header(reader)
+
+    space_class = chess.Unique_line_space if header['unique'] else chess.Line_space
+    space = space_class.__new__(space_class)
+    chess.Line_space.__init__(space, header['name'], header['is_white'], [], header['by_position'])
+    space.u_num = header['u_num']
+
+    if not header['has_root']:
+        return space
+
+    space.root = space.node_class()
+    path, remaining = [space.root], [reader.varint()]
+
+    while remaining:
+
+        if remaining[-1] == 0:
+            remaining.pop()
+            node = path.pop()
+            node.size = 1 + sum([child.size for child in node.children.values()])
+            continue
+
+        remaining[-1] -= 1
+        node = path[-1].children[reader.move()] = space.node_class()
+        path.append(node)
+        remaining.append(reader.varint())
+
+    if space.positions is not None:
+        space.index_positions()
+
+    return space
+
+
+
+def write_book(book : chess.Book, stream):
+    """Writes a book to a binary stream as a record per annotated line, in sorted order of lines.
+
+    Each line is written as the number of moves it shares with the line before it, then its remaining moves, so sublines cost only their new moves.
+    Annotations are written as their notes. Any other value held in a book must be plain data, which is written as JSON. A ValueError is raised before anything is written otherwise."""
+
+    for moves, annotation_key in book.line_index:
+
+        value = book.annotations[annotation_key]
+
+        if not is_annotations(value) and not is_plain_data(value):
+            raise ValueError(f"Book {book.name} holds a {type(value).__name__} at line '{' '.join(moves)}'. Only lists of annotations and plain data of "
+                             "strings, numbers, booleans, None, lists and dicts with string keys can be written.")
+
+    writer = Binary_writer(stream, book_kind)
+
+    writer.string(book.name)
+    writer.varint(book.by_position)
+
+    previous = ()
+
+    for moves, annotation_key in book.line_index:
+
+        shared = 0
+
+        while shared < min(len(moves), len(previous)) and moves[shared] == previous[shared]:
+            shared += 1
+
+        #Records start with one more than the number of shared moves, so a zero can mark the end of the book.
+        writer.varint(shared + 1)
+        writer.varint(len(moves) - shared)
+
+        for move in moves[shared:]:
+            writer.move(move)
+
+        write_value(writer, book.annotations[annotation_key])
+        previous = moves
+
+    writer.varint(0)
+
+
+
+def is_annotations(value) -> bool:
+
+    return isinstance(value, list) and all(isinstance(annotation, chess.Annotation) for annotation in value)
+
+
+
+def is_plain_data(value) -> bool:
+    """Checks a value is made only of data JSON holds exactly, so it reads back as it was written. Tuples are refused, as they would read back as lists."""
+
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return True
+
+    if type(value) is list:
+        return all(is_plain_data(item) for item in value)
+
+    if type(value) is dict:
+        return all(isinstance(key, str) and is_plain_data(item) for key, item in value.items())
+
+    return False
+
+
+
+def write_value(writer : Binary_writer, value):
+
+    if not is_annotations(value):
+        writer.varint(json_value)
+        writer.string(json.dumps(value))
+        return
+
+    writer.varint(annotations_value)
+    writer.varint(len(value))
+
+    for annotation in value:
+
+        writer.varint(len(annotation))
+
+        for move in annotation.list_of_moves:
+            writer.move(move)
+
+        writer.varint(len(annotation.notes))
+
+        for log in annotation.notes:
+            writer.varint(log.entry['date'].toordinal())
+            writer.string(log.entry['content'])
+
+
+
+def read_value(reader : Binary_reader):
+
+    kind = reader.varint()
+
+    if kind == json_value:
+        return json.loads(reader.string())
+
+    if kind == pickled_value:
+        raise ValueError('Stream holds a pickled value, which is not read as unpickling can run arbitrary code.')
+
+    if kind != annotations_value:
+        raise ValueError(f'Stream holds a value of unknown kind {kind}.')
+
+    value = []
+
+    for _ in range(reader.varint()):
+
+        annotation = chess.Annotation(chess.Chess_moves(*[reader.move() for _ in range(reader.varint())]))
+
+        for _ in range(reader.varint()):
+
+            log = chess.Log('')
+            log.entry['date'] = datetime.date.fromordinal(reader.varint())
+            log.entry['content'] = reader.string()
+            annotation.notes.append(log)
+
+        value.append(annotation)
+
+    return value
+
+
+
+def read_annotations(stream):
+    """Yields (line, value) pairs for each record of a book written by write_book, without building the book."""
+
+    reader = Binary_reader(stream, book_kind)
+    reader.string()
+    reader.varint()
+
+    line = []
+
+    while shared := reader.varint():
+
+        del line[shared - 1:]
+        line.extend(reader.move() for _ in range(reader.varint()))
+
+        yield chess.Chess_moves(*line), read_value(reader)
+
+
+
+def read_book(stream) -> chess.Book:
+    """Reads a book written by write_book."""
+
+    reader = Binary_reader(stream, book_kind)
+    book = chess.Book(reader.string(), bool(reader.varint()))
+
+    line = []
+
+    while shared := reader.varint():
+
+        del line[shared - 1:]
+        line.extend(reader.move() for _ in range(reader.varint()))
+
+        book[chess.Chess_moves(*line)] = read_value(reader)
+
+    return book
+
+
+
+
+
+class Pgn_writer:
+    """Object for writing PGN movetext to a text stream, wrapping lines at the width most tools expect."""
+
+    stream : object
+    width : int
+    column : int
+    previous : str
+
+
+    def __init__(self, stream, width : int = 79):
+
+        self.stream = stream
+        self.width = width
+        self.column = 0
+        self.previous = None
+
+
+
+    def token(self, text : str):
+
+        #Parentheses are written against the tokens inside them, as in '(1... e5)'.
+        separator = '' if text == ')' or self.previous == '(' else ' '
+
+        if self.column and self.column + len(separator) + len(text) > self.width:
+            self.stream.write('\n')
+            self.column = 0
+
+        elif self.column:
+            self.stream.write(separator)
+            self.column += len(separator)
+
+        self.stream.write(text)
+        self.column += len(text)
+        self.previous = text
+
+
+
+    def comment(self, text : str):
+
+        #Braces end a comment, so any within the text are replaced.
+        for word in ('{' + text.replace('{', '(').replace('}', ')') + '}').split():
+            self.token(word)
+
+
+
+def write_pgn(space : chess.Line_space, stream, book : chess.Book = None, event : str = None):
+    """Writes a line space to a text stream as a single PGN game, with every branch of the tree as a variation.
+
+    The first continuation of each move is played as the main line and the rest become variations. Notes from a book are added as comments."""
+
+    headers = [('Event', space.name if event is None else event), ('Site', '?'), ('Date', '????.??.??'), ('Round', '?'),
+               ('White', '?'), ('Black', '?'), ('Result', '*')]
+
+    for tag, value in headers:
+        stream.write(f'[{tag} "{value}"]\n')
+
+    stream.write('\n')
+    writer = Pgn_writer(stream)
+
+    if space.root is not None:
+        write_variation(writer, space.root, [], False, book)
+
+    writer.token('*')
+    stream.write('\n')
+
+
+
+def write_move(writer : Pgn_writer, move : str, line : list, needs_number : bool, book : chess.Book):
+    """Writes the move reaching the given line, numbered if it is White's or if it starts a variation or follows one, then its notes."""
+
+    ply = len(line) - 1
+
+    if ply % 2 == 0:
+        writer.token(f'{ply // 2 + 1}.')
+
+    elif needs_number:
+        writer.token(f'{ply // 2 + 1}...')
+
+    writer.token(move)
+
+    if book is not None:
+
+        value = book.get(chess.Chess_moves(*line))
+
+        for annotation in value if isinstance(value, list) else []:
+            for log in getattr(annotation, 'notes', []):
+                writer.comment(log.entry['content'])
+
+
+
+def write_variation(writer : Pgn_writer, node : chess.Line_node, line : list, needs_number : bool, book : chess.Book):
+    """Writes every continuation of a node, following the main line iteratively and recursing only into side variations."""
+
+    depth = len(line)
+
+    while node.children:
+
+        children = iter(node.children.items())
+        move, child = next(children)
+
+        line.append(move)
+        write_move(writer, move, line, needs_number, book)
+        line.pop()
+
+        needs_number = False
+
+        for side_move, side_child in children:
+
+            writer.token('(')
+            line.append(side_move)
+            write_move(writer, side_move, line, True, book)
+            write_variation(writer, side_child, line, False, book)
+            line.pop()
+            writer.token(')')
+
+            needs_number = True
+
+        line.append(move)
+        node = child
+
+    del line[depth:]
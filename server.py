@@ -0,0 +1,423 @@
+import asyncio
+import json
+import sys
+import chess
+
+
+
+
+
+class Session:
+    """Object for holding the state of one client: where it has navigated to, and the line space and book it works on by default."""
+
+    node : chess.Node
+    line_space : str
+    book : str
+
+
+    def __init__(self, data, cache : chess.Position_cache):
+
+        #Every session navigates the same data, and shares one cache of positions with the others.
+        self.node = chess.Node(data)
+        self.node.cache = cache
+        self.line_space = None
+        self.book = None
+
+
+
+
+
+def annotation_to_json(value):
+    """Converts the annotations a book holds on a line into plain data for sending to a client."""
+
+    if isinstance(value, list):
+        return [annotation_to_json(item) for item in value]
+
+    if isinstance(value, chess.Annotation):
+        return {'line' : value.list_of_moves, 'notes' : [{'date' : log.entry['date'].isoformat(), 'content' : log.entry['content']} for log in value.notes]}
+
+    return value if value is None or isinstance(value, (str, int, float, bool)) else str(value)
+
+
+
+def state_to_json(line : chess.Chess_moves, state : chess.Navigation_state) -> dict:
+
+    return {'line' : line.list_of_moves,
+            'fen' : None if state.position is None else state.position.fen(),
+            'continuations' : state.continuations,
+            'annotations' : {name : annotation_to_json(value) for name, value in state.annotations.items()}}
+
+
+
+
+
+class Repertoire_server:
+    """Object for serving the navigation, line space and book operations of a Data_tree to many clients at once.
+
+    Requests and responses are JSON objects, one per line. Requests run one at a time on the event loop, so each sees a consistent copy of the data.
+    Writers queue behind each other, and commits to the store run in a worker thread, so readers are never held up by a writer."""
+
+    data : chess.Data_tree
+    cache : chess.Position_cache
+    write_lock : asyncio.Lock
+    sessions : int
+
+
+    #Operations which change the data, and so must be applied one at a time.
+    write_operations = {'add_line', 'discard_line', 'add_note', 'delete_annotation', 'commit'}
+
+
+    def __init__(self, data : chess.Data_tree, cache_capacity : int = 4096):
+
+        self.data = data
+        self.cache = chess.Position_cache(cache_capacity)
+        self.write_lock = None
+        self.sessions = 0
+
+        #Stored objects are loaded up front, so no request reads the store while a commit is writing to it.
+        for collection in (data.line_spaces, data.books):
+            for name in list(collection):
+                collection[name]
+
+
+
+    async def serve_unix(self, path : str):
+        """Serves clients connecting to a Unix socket at the given path until cancelled."""
+
+        self.write_lock = asyncio.Lock()
+        server = await asyncio.start_unix_server(self.handle_connection, path)
+
+        async with server:
+            await server.serve_forever()
+
+
+
+    async def serve_tcp(self, host : str = '127.0.0.1', port : int = 8765):
+        """Serves clients connecting over TCP until cancelled."""
+
+        self.write_lock = asyncio.Lock()
+        server = await asyncio.start_server(self.handle_connection, host, port)
+
+        async with server:
+            await server.serve_forever()
+
+
+
+    async def handle_connection(self, reader : asyncio.StreamReader, writer : asyncio.StreamWriter):
+
+        session = Session(self.data, self.cache)
+        self.sessions += 1
+
+        try:
+            while line := await reader.readline():
+
+                request = None
+
+                #Any failure is reported back as the response to the request which caused it, so one bad request never closes the connection.
+                try:
+                    request = json.loads(line)
+
+                    if not isinstance(request, dict):
+                        raise ValueError('Requests must be JSON objects.')
+
+                    response = {'id' : request.get('id'), 'ok' : True, 'result' : await self.handle(session, request)}
+
+                except Exception as error:
+                    response = {'id' : request.get('id') if isinstance(request, dict) else None, 'ok' : False, 'error' : str(error) or type(error).__name__}
+
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+
+        except ConnectionError:
+            pass
+
+        finally:
+            self.sessions -= 1
+            writer.close()
+
+
+
+    async def handle(self, session : Session, request : dict):
+        """Carries out a single request for a session, returning its result."""
+
+        operation = request['op']
+        handler = getattr(self, 'op_' + operation, None)
+
+        if handler is None:
+            raise ValueError(f'Unknown operation {operation}.')
+
+        if operation not in self.write_operations:
+            return handler(session, request)
+
+        async with self.write_lock:
+
+            #Committing writes to disk, so it is done off the event loop. Other writers wait for it, but readers carry on.
+            if operation == 'commit':
+                return await asyncio.get_running_loop().run_in_executor(None, handler, session, request)
+
+            return handler(session, request)
+
+
+
+    def line_of(self, session : Session, request : dict) -> chess.Chess_moves:
+        """Returns the line a request refers to, by default the session's current address."""
+
+        return session.node.address if request.get('line') is None else chess.Chess_moves(*request['line'])
+
+
+
+    def line_space_of(self, session : Session, request : dict) -> chess.Line_space:
+
+        name = request.get('line_space', session.line_space)
+
+        if name not in self.data.line_spaces:
+            raise KeyError(f'No line space named {name}.')
+
+        return self.data.line_spaces[name]
+
+
+
+    def book_of(self, session : Session, request : dict) -> chess.Book:
+
+        name = request.get('book', session.book)
+
+        if name not in self.data.books:
+            raise KeyError(f'No book named {name}.')
+
+        return self.data.books[name]
+
+
+
+    #Navigation.
+
+    def op_state(self, session : Session, request : dict):
+
+        line = self.line_of(session, request)
+        return state_to_json(line, session.node.state(line))
+
+
+
+    def op_move(self, session : Session, request : dict):
+        """Plays one or more moves from the current address, checking each is legal first."""
+
+        moves = request['moves'] if isinstance(request['moves'], list) else [request['moves']]
+        position = session.node.position()
+
+        if position is None:
+            raise ValueError('The current line is not legal, so no moves can follow it.')
+
+        for move in moves:
+            position.push_san(move)
+
+        session.node.travel(*moves)
+        return self.op_state(session, {})
+
+
+
+    def op_back(self, session : Session, request : dict):
+
+        plies = request.get('plies', 1)
+
+        if plies > len(session.node.address):
+            raise ValueError('Cannot go back past the start of the game.')
+
+        for _ in range(plies):
+            session.node['..']
+
+        return self.op_state(session, {})
+
+
+
+    def op_goto(self, session : Session, request : dict):
+
+        session.node.address = chess.Chess_moves(*request['line'])
+        return self.op_state(session, {})
+
+
+
+    #Line spaces.
+
+    def op_line_spaces(self, session : Session, request : dict):
+
+        return {name : {'is_white' : space.is_white, 'lines' : len(space)} for name, space in self.data.line_spaces.items()}
+
+
+
+    def op_use_line_space(self, session : Session, request : dict):
+
+        session.line_space = self.line_space_of(session, {'line_space' : request['name']}).name
+        return session.line_space
+
+
+
+    def op_contains(self, session : Session, request : dict):
+
+        return self.line_of(session, request) in self.line_space_of(session, request)
+
+
+
+    def op_continuations(self, session : Session, request : dict):
+
+        return [continuation.list_of_moves for continuation in self.line_space_of(session, request).get_continuations(self.line_of(session, request))]
+
+
+
+    def op_add_line(self, session : Session, request : dict):
+
+        space = self.line_space_of(session, request)
+        discarded = space.add(self.line_of(session, request))
+
+        #Unique line spaces return the lines the new line replaced.
+        return [line.list_of_moves for line in discarded or []]
+
+
+
+    def op_discard_line(self, session : Session, request : dict):
+
+        self.line_space_of(session, request).discard(self.line_of(session, request))
+        return None
+
+
+
+    #Books.
+
+    def op_books(self, session : Session, request : dict):
+
+        return {name : len(book) for name, book in self.data.books.items()}
+
+
+
+    def op_use_book(self, session : Session, request : dict):
+
+        session.book = self.book_of(session, {'book' : request['name']}).name
+        return session.book
+
+
+
+    def op_annotations(self, session : Session, request : dict):
+
+        return annotation_to_json(self.book_of(session, request).get(self.line_of(session, request)))
+
+
+
+    def op_annotated_under(self, session : Session, request : dict):
+
+        return [{'line' : line.list_of_moves, 'annotations' : annotation_to_json(value)}
+                for line, value in self.book_of(session, request).annotated_under(self.line_of(session, request))]
+
+
+
+    def op_add_note(self, session : Session, request : dict):
+        """Adds a note to the annotation of a line, creating the annotation if the line has none."""
+
+        line = self.line_of(session, request)
+        annotations = self.book_of(session, request)[line]
+
+        if annotations is None:
+            raise ValueError(f'{line} is not a valid line.')
+
+        if not annotations:
+            annotations.append(chess.Annotation(line))
+
+        annotations[-1].add_note(request['note'])
+        return annotation_to_json(annotations)
+
+
+
+    def op_delete_annotation(self, session : Session, request : dict):
+
+        book, line = self.book_of(session, request), self.line_of(session, request)
+
+        if line not in book:
+            raise KeyError(f'{line} is not annotated in book {book.name}.')
+
+        del book[line]
+        return None
+
+
+
+    def op_commit(self, session : Session, request : dict):
+
+        if self.data.store is None:
+            raise ValueError('The data is not kept in a store, so there is nothing to commit to.')
+
+        self.data.commit()
+        return None
+
+
+
+
+
+class Repertoire_client:
+    """Object for sending requests to a Repertoire_server and reading its responses, for scripts and tests."""
+
+    reader : asyncio.StreamReader
+    writer : asyncio.StreamWriter
+    next_id : int
+    lock : asyncio.Lock
+
+
+    def __init__(self, reader : asyncio.StreamReader, writer : asyncio.StreamWriter):
+
+        self.reader, self.writer = reader, writer
+        self.next_id = 0
+
+        #Responses come back in the order requests were sent, so a client shared between tasks sends one request at a time.
+        self.lock = asyncio.Lock()
+
+
+
+    @classmethod
+    async def connect_unix(cls, path : str):
+
+        return cls(*await asyncio.open_unix_connection(path))
+
+
+
+    @classmethod
+    async def connect_tcp(cls, host : str = '127.0.0.1', port : int = 8765):
+
+        return cls(*await asyncio.open_connection(host, port))
+
+
+
+    async def request(self, op : str, **arguments):
+        """Sends a request and returns its result. Raises RuntimeError with the server's message if the request failed."""
+
+        async with self.lock:
+
+            self.next_id += 1
+            self.writer.write(json.dumps({'id' : self.next_id, 'op' : op, **arguments}).encode() + b'\n')
+            await self.writer.drain()
+
+            response = json.loads(await self.reader.readline())
+
+        if not response['ok']:
+            raise RuntimeError(response['error'])
+
+        return response['result']
+
+
+
+    async def close(self):
+
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+
+
+
+if __name__ == '__main__':
+
+    #Usage: python server.py store_path socket_path
+    data = chess.Data_tree(sys.argv[1])
+
+    try:
+        asyncio.run(Repertoire_server(data).serve_unix(sys.argv[2]))
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        data.close()
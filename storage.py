@@ -0,0 +1,185 @@
+import os
+import mmap
+import pickle
+import struct
+import zlib
+
+
+
+
+
+#Each record is prefixed by the length of its payload and a checksum of it.
+record_header = struct.Struct('<II')
+
+#The index holds the offset of the latest root record and the length of the committed log, followed by a checksum of both.
+index_layout = struct.Struct('<QQI')
+
+#Chains of changes longer than this are replaced by a snapshot the next time they are saved.
+max_chain_length : int = 64
+
+
+
+
+
+class Record_store:
+    """Object for holding pickled records in an append-only log file, alongside a small index pointing to the latest committed root record.
+
+    Records appended since the last commit are discarded when the store is next opened, so a crash mid-write leaves the last commit intact."""
+
+    path : str
+    root_offset : int
+    committed_length : int
+
+
+    def __init__(self, path : str):
+
+        self.path = path
+        self.index_path = path + '.index'
+        self.root_offset, self.committed_length = self.read_index()
+
+        #Anything past the committed length is an unfinished transaction, and is cut away.
+        self.log = open(path, 'a+b')
+        self.log.truncate(self.committed_length)
+        self.log.seek(0, os.SEEK_END)
+
+        self.view = None
+        self.buffer = None
+        self.view_length = 0
+
+
+
+    def read_index(self):
+        """Returns the root offset and committed log length recorded in the index. An empty store has neither."""
+
+        try:
+            with open(self.index_path, 'rb') as index_file:
+                data = index_file.read(index_layout.size)
+
+        except FileNotFoundError:
+            return None, 0
+
+        root_offset, committed_length, checksum = index_layout.unpack(data)
+
+        if zlib.crc32(data[:16]) != checksum:
+            raise IOError(f'Index of store {self.path} is corrupt.')
+
+        return root_offset, committed_length
+
+
+
+    def append(self, record) -> int:
+        """Appends a record to the log, returning its offset. The record is not durable until the next commit."""
+
+        payload = pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+        offset = self.log.tell()
+
+        self.log.write(record_header.pack(len(payload), zlib.crc32(payload)))
+        self.log.write(payload)
+
+        return offset
+
+
+
+    def read(self, offset : int):
+        """Reads the record at the given offset through a memory map of the log."""
+
+        self.log.flush()
+
+        #The map is only renewed once the log has grown past it.
+        if offset + record_header.size > self.view_length:
+            self.remap()
+
+        length, checksum = record_header.unpack_from(self.view, offset)
+        start = offset + record_header.size
+
+        #The record is checked and unpickled straight from the map, without first being copied out of it. It is still unpickled in full on every read, as the map only saves that copy.
+        with self.buffer[start : start + length] as payload:
+
+            if zlib.crc32(payload) != checksum:
+                raise IOError(f'Record at offset {offset} of store {self.path} is corrupt.')
+
+            return pickle.loads(payload)
+
+
+
+    def remap(self):
+
+        self.close_view()
+
+        self.view_length = os.fstat(self.log.fileno()).st_size
+        self.view = mmap.mmap(self.log.fileno(), self.view_length, access = mmap.ACCESS_READ) if self.view_length else None
+        self.buffer = None if self.view is None else memoryview(self.view)
+
+
+
+    def close_view(self):
+
+        #The map cannot be closed while a view of it is held.
+        if self.view is not None:
+            self.buffer.release()
+            self.view.close()
+
+
+
+    @property
+    def root(self):
+        """The latest committed root record, or None for an empty store."""
+
+        return None if self.root_offset is None else self.read(self.root_offset)
+
+
+
+    def commit(self, root):
+        """Appends a new root record and atomically points the index at it, making every record appended before it durable."""
+
+        root_offset = self.append(root)
+
+        self.log.flush()
+        os.fsync(self.log.fileno())
+
+        committed_length = self.log.tell()
+        data = struct.pack('<QQ', root_offset, committed_length)
+
+        #The index is replaced in a single rename, so it always points at a complete commit.
+        temporary_path = self.index_path + '.tmp'
+
+        with open(temporary_path, 'wb') as index_file:
+            index_file.write(data + struct.pack('<I', zlib.crc32(data)))
+            index_file.flush()
+            os.fsync(index_file.fileno())
+
+        os.replace(temporary_path, self.index_path)
+        self.root_offset, self.committed_length = root_offset, committed_length
+
+
+
+    def append_changes(self, head, changes : list, snapshot : bool = False):
+        """Appends a record of changes onto a chain of change records, returning the new head of the chain.
+
+        A head is a pair of the offset of the latest record and the length of the chain. A snapshot starts a new chain, replacing everything before it."""
+
+        previous, length = (None, 0) if head is None or snapshot else head
+        offset = self.append({'previous' : previous, 'changes' : changes})
+        return offset, length + 1
+
+
+
+    def read_changes(self, head) -> list:
+        """Returns every change in the chain with the given head, oldest first."""
+
+        records = []
+        offset = None if head is None else head[0]
+
+        while offset is not None:
+            record = self.read(offset)
+            records.append(record['changes'])
+            offset = record['previous']
+
+        return [change for changes in reversed(records) for change in changes]
+
+
+
+    def close(self):
+
+        self.close_view()
+        self.log.close()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+#The modules live at the top of the repository rather than in a package, so it is put on the path for the tests to import them.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
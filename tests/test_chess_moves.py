@@ -0,0 +1,100 @@
+import pickle
+import random
+import chess
+
+
+
+
+
+moves = ['e4', 'e5', 'Nf3', 'Nc6', 'Bb5', 'a6', 'Ba4', 'Nf6', 'O-O', 'Be7', 'exd8=Q+']
+
+
+
+def random_moves(generator : random.Random) -> list:
+
+    return [generator.choice(moves) for _ in range(generator.randint(0, 12))]
+
+
+
+
+
+def test_sequence_operations_match_a_list():
+
+    generator = random.Random(7)
+
+    for _ in range(300):
+
+        expected = random_moves(generator)
+        line = chess.Chess_moves(*expected)
+        assert line.list_of_moves == expected
+
+        index = generator.randint(0, len(expected))
+        move = generator.choice(moves)
+        line.insert(index, move)
+        expected.insert(index, move)
+        assert list(line) == expected
+
+        if expected:
+
+            index = generator.randrange(len(expected))
+            del line[index]
+            del expected[index]
+            assert list(line) == expected
+
+            index = generator.randrange(len(expected)) if expected else None
+
+            if index is not None:
+                line[index] = 'd4'
+                expected[index] = 'd4'
+
+        line.add_move('h3')
+        expected.append('h3')
+        assert list(line) == expected and len(line) == len(expected)
+
+
+
+def test_slices_are_equal_and_hash_like_copies():
+
+    generator = random.Random(8)
+
+    for _ in range(300):
+
+        expected = random_moves(generator)
+        line = chess.Chess_moves(*expected)
+        start, stop = sorted(generator.randint(0, len(expected)) for _ in range(2))
+
+        piece = line[start:stop]
+        copy = chess.Chess_moves(*expected[start:stop])
+
+        assert list(piece) == expected[start:stop]
+        assert piece == copy and hash(piece) == hash(copy)
+        assert line[::-1].list_of_moves == expected[::-1]
+
+
+
+def test_views_do_not_share_changes():
+
+    line = chess.Chess_moves('e4', 'e5', 'Nf3')
+    view = line[:2]
+    view.add_move('d4')
+    line.add_move('Nc6')
+
+    assert view.list_of_moves == ['e4', 'e5', 'd4']
+    assert line.list_of_moves == ['e4', 'e5', 'Nf3', 'Nc6']
+
+
+
+def test_lines_differing_in_one_move_are_unequal():
+
+    assert chess.Chess_moves('e4', 'e5') != chess.Chess_moves('e4', 'd5')
+    assert chess.Chess_moves('e4') != chess.Chess_moves('e4', 'e5')
+
+
+
+def test_pickling_keeps_moves():
+
+    line = chess.Chess_moves('e4', 'e5', 'exd8=Q+')
+    copy = pickle.loads(pickle.dumps(line))
+
+    assert copy == line and copy.list_of_moves == line.list_of_moves
+    assert pickle.loads(pickle.dumps(line[1:])).list_of_moves == ['e5', 'exd8=Q+']
@@ -0,0 +1,62 @@
+import io
+import pickle
+import pytest
+import chess
+import interchange
+
+
+
+
+
+def round_trip(book : chess.Book) -> chess.Book:
+
+    stream = io.BytesIO()
+    interchange.write_book(book, stream)
+    stream.seek(0)
+    return interchange.read_book(stream)
+
+
+
+def test_plain_data_round_trips():
+
+    book = chess.Book('book')
+    book[chess.Chess_moves('e4')] = [chess.Annotation(chess.Chess_moves('e4'))]
+    book[chess.Chess_moves('e4', 'e5')] = {'eval' : 0.3, 'tags' : ['open', None], 'seen' : 2}
+
+    result = round_trip(book)
+
+    assert result[chess.Chess_moves('e4', 'e5')] == {'eval' : 0.3, 'tags' : ['open', None], 'seen' : 2}
+    assert len(result[chess.Chess_moves('e4')]) == 1
+
+
+
+@pytest.mark.parametrize('value', [('a', 'b'), {1 : 'a'}, {'a', 'b'}, object()])
+def test_other_values_are_refused_before_writing(value):
+
+    book = chess.Book('book')
+    book[chess.Chess_moves('d4')] = value
+    stream = io.BytesIO()
+
+    with pytest.raises(ValueError, match = 'd4'):
+        interchange.write_book(book, stream)
+
+    assert stream.getvalue() == b''
+
+
+
+def test_pickled_values_are_never_read():
+
+    writer_stream = io.BytesIO()
+    writer = interchange.Binary_writer(writer_stream, interchange.book_kind)
+    writer.string('book')
+    writer.varint(False)
+    writer.varint(1)
+    writer.varint(1)
+    writer.move('e4')
+    writer.varint(interchange.pickled_value)
+    writer.bytes(pickle.dumps(['anything']))
+    writer.varint(0)
+    writer_stream.seek(0)
+
+    with pytest.raises(ValueError, match = 'pickled'):
+        interchange.read_book(writer_stream)
@@ -0,0 +1,198 @@
+import random
+import pytest
+import chess
+
+
+
+
+
+#Moves are drawn from a small alphabet, so random lines share prefixes and branch often. The trie does not check legality.
+alphabet = ['e4', 'd4', 'Nf3', 'c4', 'e5', 'd5']
+
+
+
+def random_lines(generator : random.Random, count : int, max_length : int = 5) -> list:
+
+    return [tuple(generator.choice(alphabet) for _ in range(generator.randint(0, max_length))) for _ in range(count)]
+
+
+
+def closure(lines) -> set:
+    """Returns the lines with every one of their sublines, as a line space holds them."""
+
+    return {line[:length] for line in lines for length in range(len(line) + 1)}
+
+
+
+def lines_of(space : chess.Line_space) -> set:
+
+    return {tuple(line) for line in space}
+
+
+
+def space_of(lines, name = 'space') -> chess.Line_space:
+
+    return chess.Line_space(name, True, [chess.Chess_moves(*line) for line in lines])
+
+
+
+def pairs(trials : int = 200):
+    """Yields pairs of random spaces along with the sets of lines they should hold."""
+
+    generator = random.Random(20230322)
+
+    for _ in range(trials):
+
+        first, second = random_lines(generator, generator.randint(0, 8)), random_lines(generator, generator.randint(0, 8))
+
+        #Some pairs share lines, so shared subtrees are exercised as well as differing ones.
+        if generator.random() < 0.3:
+            second += first[:generator.randint(0, len(first))]
+
+        yield space_of(first), closure(first), space_of(second), closure(second)
+
+
+
+
+
+def test_add_discard_and_continuations_match_a_plain_set():
+
+    generator = random.Random(1)
+    space, expected = chess.Line_space('space', True, []), set()
+
+    for _ in range(2000):
+
+        line = random_lines(generator, 1)[0]
+
+        if generator.random() < 0.6:
+            space.add(chess.Chess_moves(*line))
+            expected |= closure([line])
+
+        else:
+            space.discard(chess.Chess_moves(*line))
+            expected = {other for other in expected if other[:len(line)] != line}
+
+        assert lines_of(space) == expected
+        assert len(space) == len(expected)
+
+        probe = random_lines(generator, 1)[0]
+        assert (chess.Chess_moves(*probe) in space) == (probe in expected)
+        assert {tuple(continuation) for continuation in space.get_continuations(chess.Chess_moves(*probe))} == \
+               {other for other in expected if len(other) == len(probe) + 1 and other[:-1] == probe}
+
+
+
+def test_set_operators_match_plain_sets():
+
+    for first, first_lines, second, second_lines in pairs():
+
+        #A difference keeps every subline of the lines left, as a space cannot hold a line without them.
+        assert lines_of(first | second) == first_lines | second_lines
+        assert lines_of(first & second) == first_lines & second_lines
+        assert lines_of(first - second) == closure(first_lines - second_lines)
+        assert lines_of(first ^ second) == closure(first_lines - second_lines) | closure(second_lines - first_lines)
+
+        assert (first <= second) == (first_lines <= second_lines)
+        assert (first >= second) == (first_lines >= second_lines)
+        assert (first < second) == (first_lines < second_lines)
+        assert (first == second) == (first_lines == second_lines)
+
+
+
+def test_in_place_operators_match_plain_sets():
+
+    for first, first_lines, second, second_lines in pairs(100):
+
+        for operator, expected in (('__ior__', first_lines | second_lines), ('__iand__', first_lines & second_lines), ('__isub__', closure(first_lines - second_lines))):
+
+            result = getattr(first.copy(), operator)(second)
+            assert lines_of(result) == expected
+            assert result.root is None or result.root.size == len(expected)
+
+
+
+def test_set_operators_do_not_change_their_operands():
+
+    for first, first_lines, second, second_lines in pairs(50):
+
+        first | second, first & second, first - second, first ^ second
+        assert lines_of(first) == first_lines and lines_of(second) == second_lines
+
+
+
+def test_colliding_digests_do_not_change_results(monkeypatch):
+
+    #Every subtree is given the same digest, so only the structural check can tell them apart.
+    monkeypatch.setattr(chess.Line_node, 'get_digest', lambda node : 0)
+
+    for first, first_lines, second, second_lines in pairs(100):
+
+        assert lines_of(first | second) == first_lines | second_lines
+        assert lines_of(first & second) == first_lines & second_lines
+        assert lines_of(first - second) == closure(first_lines - second_lines)
+        assert (first <= second) == (first_lines <= second_lines)
+        assert (first == second) == (first_lines == second_lines)
+
+
+
+def test_operators_accept_plain_sets():
+
+    space = space_of([('e4', 'e5'), ('d4',)])
+    extra = chess.Chess_moves('c4')
+
+    assert space == set(space)
+    assert space <= set(space) | {extra}
+    assert lines_of(space | {extra}) == lines_of(space) | {('c4',), ()}
+
+
+
+def test_generic_operators_keep_the_colour_and_name():
+
+    space = chess.Line_space('black lines', False, [chess.Chess_moves('e4', 'e5')])
+    result = space | {chess.Chess_moves('d4')}
+
+    assert result.is_white is False
+    assert result.name == 'black lines'
+
+
+
+def test_unique_union_keeps_uniqueness():
+
+    first = chess.Unique_line_space('first', True, [chess.Chess_moves('e4', 'e5', 'Nf3')], 1)
+    second = chess.Unique_line_space('second', True, [chess.Chess_moves('e4', 'e5', 'Nc3')], 1)
+    result = first | second
+
+    assert isinstance(result, chess.Unique_line_space)
+    assert all(result.check_uniqueness(line) for line in result.end_lines())
+    assert set(result.end_lines()) == {('e4', 'e5', 'Nc3')}
+
+
+
+@pytest.mark.parametrize('min_count', [1, 2, 3])
+def test_build_matches_adding_lines(min_count):
+
+    generator = random.Random(min_count)
+    lines = random_lines(generator, 300, 6)
+    space = chess.Line_space('space', True, [])
+    space.build([chess.Chess_moves(*line) for line in lines], max_ply = 4, min_count = min_count)
+
+    counts = dict()
+
+    for line in lines:
+        for length in range(min(len(line), 4) + 1):
+            counts[line[:length]] = counts.get(line[:length], 0) + 1
+
+    assert lines_of(space) == {line for line, count in counts.items() if count >= min_count}
+
+
+
+@pytest.mark.parametrize('by_position', [False, True])
+def test_deviation_only_where_the_space_has_moves(by_position):
+
+    space = chess.Line_space('space', True, [chess.Chess_moves('e4', 'e5', 'Nf3'), chess.Chess_moves('d4')], by_position)
+
+    assert space.deviation(chess.Chess_moves('e4', 'c5')) == (1, 'c5')
+    assert space.deviation(chess.Chess_moves('c4')) == (0, 'c4')
+    assert space.deviation(chess.Chess_moves('e4', 'e5', 'Nf3', 'Nc6', 'Bb5')) is None
+    assert space.deviation(chess.Chess_moves('d4', 'd5', 'c4')) is None
+    assert chess.Line_space('empty', True, [], by_position).deviation(chess.Chess_moves('e4')) is None